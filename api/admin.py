@@ -68,13 +68,49 @@ class CustomUserAdmin(UserAdmin):
     filter_horizontal = ()
 
 
+class AllObjectsAdmin(admin.ModelAdmin):
+    """
+    Lets foreign keys point at soft deleted rows, an order line of a
+    deleted product must stay editable.
+    """
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if 'queryset' not in kwargs and hasattr(db_field.related_model, 'all_objects'):
+            kwargs['queryset'] = db_field.related_model.all_objects.all()
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+class SoftDeleteAdmin(AllObjectsAdmin):
+    """
+    Lists deleted rows too, which the default manager hides, so they can
+    be found and restored.
+    """
+    list_filter = (('_deleted', admin.EmptyFieldListFilter),)
+    actions = ('soft_delete_selected', 'restore_selected')
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.all()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    @admin.action(description='Soft delete selected rows')
+    def soft_delete_selected(self, request, queryset):
+        count = queryset.soft_delete()
+        self.message_user(request, f'Deleted {count} rows')
+
+    @admin.action(description='Restore selected rows')
+    def restore_selected(self, request, queryset):
+        count = queryset.restore()
+        self.message_user(request, f'Restored {count} rows')
+
+
 admin.site.register(User, CustomUserAdmin)
 
-admin.site.register(Category)
-admin.site.register(Product)
-admin.site.register(Order)
-admin.site.register(OrderDetail)
-admin.site.register(Review)
-admin.site.register(History)
-admin.site.register(Cart)
-admin.site.register(Coupon)
+admin.site.register(Category, SoftDeleteAdmin)
+admin.site.register(Product, SoftDeleteAdmin)
+admin.site.register(Order, AllObjectsAdmin)
+admin.site.register(OrderDetail, AllObjectsAdmin)
+admin.site.register(Review, AllObjectsAdmin)
+admin.site.register(History, AllObjectsAdmin)
+admin.site.register(Cart, SoftDeleteAdmin)
+admin.site.register(Coupon, AllObjectsAdmin)
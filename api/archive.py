@@ -0,0 +1,80 @@
+import gzip
+import json
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import History
+
+
+def archive_directory():
+    return Path(getattr(settings, 'HISTORY_ARCHIVE_DIR', settings.BASE_DIR / 'archive' / 'history'))
+
+def archive_path(month, directory=None):
+    return (directory or archive_directory()) / f'history-{month}.ndjson.gz'
+
+def archive_history(before, directory=None, batch_size=1000):
+    """
+    Move History rows created before the datetime before into gzipped
+    NDJSON files, one per month of the local creation date. Each batch is
+    appended as its own gzip member before its rows are deleted, so an
+    interrupted run never loses rows. Returns the number of rows moved.
+    """
+    directory = directory or archive_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    moved = 0
+    while True:
+        rows = list(
+            History.objects.filter(_created__lt=before).order_by('id').values(
+                'id', '_creator', '_created', 'message'
+            )[:batch_size]
+        )
+        if len(rows) == 0:
+            return moved
+        months = {}
+        for row in rows:
+            month = timezone.localtime(row['_created']).strftime('%Y-%m')
+            row['_created'] = row['_created'].isoformat()
+            months.setdefault(month, []).append(row)
+        for month, month_rows in months.items():
+            with gzip.open(archive_path(month, directory), 'at', encoding='utf-8') as archive:
+                for row in month_rows:
+                    archive.write(json.dumps(row, ensure_ascii=False) + '\n')
+        History.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+def iter_archive(month, directory=None):
+    """
+    Stream the archived rows of a month (YYYY-MM) as dicts.
+    """
+    path = archive_path(month, directory)
+    if not path.exists():
+        return
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
+
+def restore_archive(month, directory=None, batch_size=1000):
+    """
+    Insert the archived rows of a month back into History. Rows that are
+    already present are skipped. Returns the number of rows read.
+    """
+    restored = 0
+    batch = []
+    with transaction.atomic():
+        for row in iter_archive(month, directory):
+            batch.append(History(
+                id=row['id'],
+                _creator_id=row['_creator'],
+                _created=parse_datetime(row['_created']),
+                message=row['message'],
+            ))
+            if len(batch) >= batch_size:
+                History.objects.bulk_create(batch, ignore_conflicts=True)
+                restored += len(batch)
+                batch = []
+        History.objects.bulk_create(batch, ignore_conflicts=True)
+        restored += len(batch)
+    return restored
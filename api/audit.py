@@ -0,0 +1,140 @@
+import atexit
+import logging
+import threading
+from functools import partial
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import History
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """
+    Queues History entries per process and writes them with bulk_create
+    once max_batch entries are waiting or the oldest one is max_delay
+    seconds old. Entries logged inside a transaction are only queued
+    when it commits, and the request that logged them flushes the queue
+    when it ends. A batch the database rejects is retried row by row so
+    one bad entry does not lose the others.
+
+    With settings.AUDIT_LOG_BUFFERED = False every entry is written
+    immediately in the caller's transaction, which is what tests want.
+    """
+    def __init__(self, max_batch=100, max_delay=2.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._entries = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._request = threading.local()
+        self.logged = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def log(self, user_id, message):
+        entry = History(_creator_id=user_id, message=message, _created=timezone.now())
+        if not getattr(settings, 'AUDIT_LOG_BUFFERED', True):
+            History.objects.bulk_create([entry])
+            with self._lock:
+                self.logged += 1
+                self.written += 1
+                self.batches += 1
+            return
+        if transaction.get_connection().in_atomic_block:
+            self._request.flush_at_end = True
+        transaction.on_commit(partial(self._enqueue, entry))
+
+    def _enqueue(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            self.logged += 1
+            full = len(self._entries) >= self.max_batch
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """
+        Write every queued entry, returns the number written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                entries = self._entries
+                self._entries = []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if len(entries) == 0:
+                return 0
+            try:
+                with transaction.atomic():
+                    History.objects.bulk_create(entries, batch_size=self.max_batch)
+            except Exception:
+                logger.exception('Could not write %d audit log entries, retrying one by one', len(entries))
+                return self._write_one_by_one(entries)
+            with self._lock:
+                self.written += len(entries)
+                self.batches += 1
+            return len(entries)
+
+    def _write_one_by_one(self, entries):
+        written = 0
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    History.objects.bulk_create([entry])
+                written += 1
+            except Exception:
+                logger.exception('Could not write audit log entry %r', entry.message)
+                with self._lock:
+                    self.failed += 1
+        with self._lock:
+            self.written += written
+            self.batches += 1
+        return written
+
+    def flush_at_request_end(self, **kwargs):
+        """
+        request_finished receiver: flush what a request logged inside a
+        transaction, the entries were queued when it committed.
+        """
+        if getattr(self._request, 'flush_at_end', False):
+            self._request.flush_at_end = False
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._entries),
+                'logged': self.logged,
+                'written': self.written,
+                'batches': self.batches,
+                'failed': self.failed,
+            }
+
+audit_writer = AuditLogWriter(
+    max_batch=getattr(settings, 'AUDIT_LOG_MAX_BATCH', 100),
+    max_delay=getattr(settings, 'AUDIT_LOG_MAX_DELAY', 2.0),
+)
+atexit.register(audit_writer.flush)
+request_finished.connect(audit_writer.flush_at_request_end, dispatch_uid='audit_log_flush')
+
+def audit_log(user_id, message):
+    audit_writer.log(user_id, message)
+
+def audit_log_stats():
+    return audit_writer.stats()
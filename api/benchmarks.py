@@ -0,0 +1,53 @@
+import time
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import override_settings
+
+# Benchmarks must measure the queries, not the response cache
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the body against a throwaway database created like the test
+    database, so a benchmark never writes to the real one.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(CACHES=NO_CACHE):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+def summarize(timings):
+    """
+    Mean, p50 and p99 of timings given in seconds, in milliseconds.
+    """
+    return {
+        'mean': sum(timings) / len(timings) * 1000,
+        'p50': percentile(timings, 0.5) * 1000,
+        'p99': percentile(timings, 0.99) * 1000,
+    }
+
+def measure(function, repeat):
+    """
+    Call function repeat times and summarize how long the calls took.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+def format_timings(label, timings):
+    return (
+        f'{label:<32} mean {timings["mean"]:8.2f} ms'
+        f'  p50 {timings["p50"]:8.2f} ms  p99 {timings["p99"]:8.2f} ms'
+    )
@@ -0,0 +1,174 @@
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from .helper import ExpiringLRUCache
+from .invalidation import invalidation_bus
+from .models import Coupon, Product
+
+CATALOG = 'catalog'
+COUPON = 'coupon'
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+OBJECT_CACHE_SIZE = getattr(settings, 'OBJECT_CACHE_SIZE', 2048)
+OBJECT_CACHE_TIMEOUT = getattr(settings, 'OBJECT_CACHE_TIMEOUT', 300)
+
+
+def get_namespace_version(namespace):
+    return invalidation_bus.version(namespace)
+
+def bump_namespace_version(namespace):
+    """
+    Invalidate every cached entry of the namespace, in every worker, by
+    moving it to a new version.
+    """
+    return invalidation_bus.publish(namespace)
+
+def bump_catalog_version():
+    return bump_namespace_version(CATALOG)
+
+def bump_coupon_version():
+    return bump_namespace_version(COUPON)
+
+def response_cache_key(namespace, request):
+    url = request.build_absolute_uri()
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    return f'response:{namespace}:{get_namespace_version(namespace)}:{digest}'
+
+def cached_response(namespace=CATALOG, timeout=None):
+    """
+    Cache the data of successful responses of an APIView handler under the
+    current version of the namespace. Writers call bump_namespace_version
+    so readers never get a response built from older data.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = response_cache_key(namespace, request)
+            cached = cache.get(key)
+            if cached is not None:
+                data, status_code = cached
+                return Response(data, status=status_code)
+            response = handler(self, request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                cache.set(
+                    key,
+                    (response.data, response.status_code),
+                    RESPONSE_CACHE_TIMEOUT if timeout is None else timeout
+                )
+            return response
+        return wrapper
+    return decorator
+
+def get_or_compute(key, compute, timeout, stale_timeout=60, lock_timeout=10, wait=1.0):
+    """
+    Return the value cached under key while it is younger than timeout
+    seconds. Once it is older, only the caller that takes the lock
+    recomputes it; the others keep getting the stale value (kept for
+    stale_timeout more seconds) or, when there is none yet, wait up to
+    wait seconds for the recomputed one.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if fresh_until > time.time():
+            return value
+
+    lock_key = f'lock:{key}'
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, (value, time.time() + timeout), timeout + stale_timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry[0]
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+class ObjectCache:
+    """
+    Model instances looked up by a unique field, kept in a per-process LRU
+    in front of the Django cache. Entries of both tiers are stamped with
+    the version of namespace, so bump_namespace_version(namespace) makes
+    every worker reload them. The instances are shared between requests
+    and must be treated as read-only.
+    """
+    def __init__(self, model, namespace, field='pk', max_size=OBJECT_CACHE_SIZE, timeout=OBJECT_CACHE_TIMEOUT):
+        self.model = model
+        self.namespace = namespace
+        self.field = field
+        self.timeout = timeout
+        self.local = ExpiringLRUCache(max_size)
+
+    def _key(self, version, value):
+        return f'object:{self.namespace}:{version}:{self.model._meta.label_lower}:{self.field}:{value}'
+
+    def _remember(self, version, value, instance):
+        self.local.set(value, (version, instance), time.time() + self.timeout)
+
+    def get_many(self, values):
+        """
+        Return {value: instance} for the values that match a row, reading
+        the database once for everything missing from both tiers.
+        """
+        version = get_namespace_version(self.namespace)
+        found = {}
+        missing = []
+        for value in dict.fromkeys(values):
+            entry = self.local.get(value)
+            if entry is not None and entry[0] == version:
+                found[value] = entry[1]
+            else:
+                missing.append(value)
+        if len(missing) == 0:
+            return found
+
+        keys = {self._key(version, value): value for value in missing}
+        for key, instance in cache.get_many(keys).items():
+            found[keys[key]] = instance
+            self._remember(version, keys[key], instance)
+        missing = [value for value in missing if value not in found]
+        if len(missing) == 0:
+            return found
+
+        loaded = {}
+        # Highest id first so the lowest id wins when the field is not unique
+        rows = self.model._default_manager.filter(**{f'{self.field}__in': missing}).order_by('-pk')
+        for instance in rows:
+            loaded[getattr(instance, self.field)] = instance
+        cache.set_many(
+            {self._key(version, value): instance for value, instance in loaded.items()},
+            self.timeout
+        )
+        for value, instance in loaded.items():
+            self._remember(version, value, instance)
+        found.update(loaded)
+        return found
+
+    def get(self, value):
+        """
+        Like Model.objects.get(field=value), raises Model.DoesNotExist.
+        """
+        instance = self.get_many([value]).get(value)
+        if instance is None:
+            raise self.model.DoesNotExist(f'{self.model.__name__} matching {self.field}={value!r} does not exist')
+        return instance
+
+    def clear(self):
+        self.local.clear()
+
+product_cache = ObjectCache(Product, CATALOG)
+coupon_cache = ObjectCache(Coupon, COUPON, field='code')
+invalidation_bus.subscribe(CATALOG, product_cache.clear)
+invalidation_bus.subscribe(COUPON, coupon_cache.clear)
@@ -0,0 +1,143 @@
+import csv
+import json
+from collections import defaultdict
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from .models import OrderDetail
+
+EXPORT_CHUNK_SIZE = 1000
+
+ORDER_FIELDS = (
+    'id',
+    '_created',
+    '_updated',
+    'user',
+    'user__name',
+    'user__email',
+    'price',
+    'payment_method',
+    'order_status',
+    'address',
+    'note',
+)
+
+ORDER_LINE_FIELDS = (
+    'id',
+    'product',
+    'name',
+    'price',
+    'quantity',
+)
+
+USER_FIELDS = (
+    'id',
+    'username',
+    'name',
+    'email',
+    'phone',
+    'address',
+    'date_of_birth',
+    'balance',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+    'date_joined',
+    'last_login',
+)
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, lets csv.writer
+    produce rows for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterate over queryset.values(*fields) in id order, one chunk at a time
+    with a keyset condition, so neither the database driver nor Python
+    holds more than chunk_size rows.
+    """
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        chunk = list(chunk.values(*fields)[:chunk_size])
+        if len(chunk) == 0:
+            return
+        yield from chunk
+        last_id = chunk[-1]['id']
+
+def iter_orders_with_lines(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield (order, lines) pairs of dicts, the lines of each chunk of
+    orders are loaded with one query.
+    """
+    chunk = []
+    for order in iter_rows(orders, ORDER_FIELDS, chunk_size):
+        chunk.append(order)
+        if len(chunk) == chunk_size:
+            yield from _attach_lines(chunk)
+            chunk = []
+    yield from _attach_lines(chunk)
+
+def _attach_lines(orders):
+    if len(orders) == 0:
+        return
+    lines = defaultdict(list)
+    details = OrderDetail.objects.filter(
+        order__in=[order['id'] for order in orders]
+    ).order_by('id').values('order', *ORDER_LINE_FIELDS)
+    for detail in details:
+        lines[detail.pop('order')].append(detail)
+    for order in orders:
+        yield order, lines[order['id']]
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+def order_ndjson(orders):
+    return ndjson_lines(
+        dict(order, lines=lines)
+        for order, lines in iter_orders_with_lines(orders)
+    )
+
+def order_csv(orders):
+    """
+    One row per order line, orders without lines get one row with empty
+    line columns.
+    """
+    header = list(ORDER_FIELDS) + [f'line__{field}' for field in ORDER_LINE_FIELDS]
+    empty_line = dict.fromkeys(ORDER_LINE_FIELDS, '')
+
+    def rows():
+        for order, lines in iter_orders_with_lines(orders):
+            order_values = [order[field] for field in ORDER_FIELDS]
+            for line in lines or [empty_line]:
+                yield order_values + [line[field] for field in ORDER_LINE_FIELDS]
+    return csv_lines(header, rows())
+
+def user_ndjson(users):
+    return ndjson_lines(iter_rows(users, USER_FIELDS))
+
+def user_csv(users):
+    return csv_lines(
+        USER_FIELDS,
+        ([user[field] for field in USER_FIELDS] for user in iter_rows(users, USER_FIELDS))
+    )
+
+def streaming_export(lines, output, filename):
+    content_type = 'text/csv' if output == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(lines, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -0,0 +1,91 @@
+from functools import partial
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ParseError
+from rest_framework.serializers import BaseSerializer
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin accepting fields= and exclude= keyword arguments,
+    iterables of field names, to drop fields from the output.
+    """
+    # Computed fields (SerializerMethodField, source='*') mapped to the model fields they read
+    sparse_sources = {}
+
+    def __init__(self, *args, fields=None, exclude=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        unknown = (set(fields or ()) | set(exclude or ())) - set(self.fields)
+        if len(unknown) > 0:
+            raise ParseError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in exclude or ():
+            self.fields.pop(name, None)
+
+    def model_columns(self):
+        """
+        Model field names backing the remaining fields, in QuerySet.only()
+        syntax, or None when a field cannot be mapped to columns.
+        """
+        opts = self.Meta.model._meta
+        columns = set()
+        for name, field in self.fields.items():
+            if name in self.sparse_sources:
+                columns.update(self.sparse_sources[name])
+                continue
+            if field.source == '*':
+                return None
+            attr = field.source_attrs[0]
+            try:
+                model_field = opts.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                continue
+            if model_field.concrete:
+                columns.add(attr)
+            if isinstance(field, BaseSerializer):
+                columns.update(
+                    f'{attr}__{related.name}'
+                    for related in model_field.related_model._meta.concrete_fields
+                )
+            elif len(field.source_attrs) > 1:
+                columns.add('__'.join(field.source_attrs))
+        return columns
+
+
+def requested_fieldset(request):
+    """
+    Parse ?fields=a,b and ?exclude=c into serializer keyword arguments.
+    """
+    fieldset = {}
+    for param in ('fields', 'exclude'):
+        value = request.query_params.get(param, None)
+        if value is not None:
+            fieldset[param] = [name.strip() for name in value.split(',') if name.strip()]
+    return fieldset
+
+def sparse_fieldset(request, queryset, serializer_class, keep=()):
+    """
+    Apply the fieldset requested by the client: returns the queryset
+    restricted with only() to the columns still serialized (plus the
+    model fields in keep, which the view reads itself) and the serializer
+    class bound to the fieldset. Without ?fields= or ?exclude= both are
+    returned unchanged.
+    """
+    fieldset = requested_fieldset(request)
+    if len(fieldset) == 0:
+        return queryset, serializer_class
+    columns = serializer_class(**fieldset).model_columns()
+    if columns is not None:
+        columns.update(keep)
+        joined = queryset.query.select_related
+        joined = set(joined) if isinstance(joined, dict) else set()
+        relations = {column.split('__')[0] for column in columns if '__' in column} & joined
+        columns = {column for column in columns if column.split('__')[0] in relations or '__' not in column}
+        queryset = queryset.select_related(None)
+        if len(relations) > 0:
+            queryset = queryset.select_related(*relations)
+        queryset = queryset.only(*columns)
+    return queryset, partial(serializer_class, **fieldset)
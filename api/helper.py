@@ -1,14 +1,84 @@
 from .models import User
+from .invalidation import invalidation_bus
 from rest_framework.response import Response
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, ParseError
 from rest_framework import status
+from collections import OrderedDict
+from datetime import date, datetime, time as datetime_time, timedelta
+from django.conf import settings
+from django.utils import timezone
+import hashlib
+import threading
+import time
 import jwt
 
-def user_authentication(request):
-    token = request.data.get('token', None)
+TOKEN_CACHE_SIZE = getattr(settings, 'TOKEN_CACHE_SIZE', 4096)
+ROLE_CACHE_SIZE = getattr(settings, 'ROLE_CACHE_SIZE', 1024)
+ROLE_CACHE_TTL = getattr(settings, 'ROLE_CACHE_TTL', 30)
 
-    if token is None:
-        raise AuthenticationFailed('User is not authenticated')
+USERS = 'users'
+
+class ExpiringLRUCache:
+    """
+    Thread safe LRU where each entry also carries its own expiry timestamp.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, expires_at=None):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+token_cache = ExpiringLRUCache(TOKEN_CACHE_SIZE)
+role_cache = ExpiringLRUCache(ROLE_CACHE_SIZE)
+invalidation_bus.subscribe(USERS, role_cache.clear)
+
+def decode_token(token):
+    """
+    Verify a JWT and return its payload. Verified payloads are kept until
+    the token's exp so repeated calls skip the signature check.
+    """
+    digest = hashlib.sha256(str(token).encode('utf-8')).hexdigest()
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return payload
 
     try:
         payload = jwt.decode(token, 'secret', algorithms=['HS256'])
@@ -18,11 +88,97 @@ def user_authentication(request):
         raise AuthenticationFailed('Invalid token signature')
     except:
         raise AuthenticationFailed('An error has occurred while decoding token')
+    token_cache.set(digest, payload, payload.get('exp'))
     return payload
 
+def user_authentication(request):
+    token = request.data.get('token', None)
+
+    if token is None:
+        raise AuthenticationFailed('User is not authenticated')
+
+    return decode_token(token)
+
+def header_authentication(request):
+    """
+    user_authentication for requests whose body is not a form or JSON:
+    the token comes from an "Authorization: Bearer" header or ?token=.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer '):
+        token = header[len('Bearer '):].strip()
+    else:
+        token = request.query_params.get('token', None)
+
+    if not token:
+        raise AuthenticationFailed('User is not authenticated')
+
+    return decode_token(token)
+
+def get_user_role(user_id):
+    """
+    Return (is_staff, is_superuser) of a user, cached for ROLE_CACHE_TTL seconds.
+    """
+    role = role_cache.get(user_id)
+    if role is None:
+        role = User.objects.filter(id=user_id).values_list('is_staff', 'is_superuser').first()
+        if role is None:
+            raise AuthenticationFailed('User not found')
+        role_cache.set(user_id, role, time.time() + ROLE_CACHE_TTL)
+    return role
+
+def invalidate_user_role(user_id):
+    role_cache.delete(int(user_id))
+    invalidation_bus.publish(USERS)
+
 def user_permission_authentication(request):
     payload = user_authentication(request)
-    user = User.objects.filter(id=payload['id']).first()
-    if not user.is_staff and not user.is_superuser:
+    is_staff, is_superuser = get_user_role(payload['id'])
+    if not is_staff and not is_superuser:
         raise AuthenticationFailed('Access denied')
-    return payload
\ No newline at end of file
+    return payload
+
+def authentication_cache_stats():
+    return {
+        'token': token_cache.stats(),
+        'role': role_cache.stats(),
+    }
+
+def date_range_filter(queryset, request, field='_created'):
+    """
+    Filter queryset by the ?start= and ?end= dates (YYYY-MM-DD, inclusive,
+    in the current timezone) on a datetime field.
+    """
+    tz = timezone.get_current_timezone()
+    try:
+        start = request.query_params.get('start', None)
+        if start is not None:
+            start = datetime.combine(date.fromisoformat(start), datetime_time.min)
+            queryset = queryset.filter(**{f'{field}__gte': timezone.make_aware(start, tz)})
+        end = request.query_params.get('end', None)
+        if end is not None:
+            end = datetime.combine(date.fromisoformat(end) + timedelta(days=1), datetime_time.min)
+            queryset = queryset.filter(**{f'{field}__lt': timezone.make_aware(end, tz)})
+    except ValueError:
+        raise ParseError('start and end must be dates in YYYY-MM-DD format')
+    return queryset
+
+def order_filter(queryset, request):
+    """
+    Filter an Order queryset by the ?start=, ?end=, ?status=,
+    ?payment_method= and ?user= query parameters.
+    """
+    queryset = date_range_filter(queryset, request)
+    order_status = request.query_params.get('status', None)
+    if order_status is not None:
+        queryset = queryset.filter(order_status=order_status)
+    payment_method = request.query_params.get('payment_method', None)
+    if payment_method is not None:
+        queryset = queryset.filter(payment_method=payment_method)
+    user_id = request.query_params.get('user', None)
+    if user_id is not None:
+        try:
+            queryset = queryset.filter(user=int(user_id))
+        except ValueError:
+            raise ParseError('user must be a user id')
+    return queryset
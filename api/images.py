@@ -0,0 +1,172 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from PIL import Image, ImageOps
+from .helper import ExpiringLRUCache
+
+DERIVATIVE_DIR = getattr(settings, 'IMAGE_DERIVATIVE_DIR', 'derivatives')
+DERIVATIVE_SIZES = getattr(settings, 'IMAGE_DERIVATIVE_SIZES', {'thumb': 160, 'small': 320, 'medium': 640})
+SOURCE_DIRS = getattr(settings, 'IMAGE_SOURCE_DIRS', ['product_image', 'category_image', 'avatars', 'uploads'])
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+DIGEST_LENGTH = 16
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+    'png': {'format': 'PNG', 'optimize': True},
+}
+
+# <source path>.<digest>-<size>.<ext>, e.g. product_image/Pepsi.png.3f2a...-thumb.webp
+DERIVATIVE_RE = re.compile(r'^(?P<source>.+)\.(?P<digest>[0-9a-f]{%d})-(?P<size>\w+)\.(?P<ext>webp|jpg|png)$' % DIGEST_LENGTH)
+
+# (path, mtime, size) -> digest, so serializing a list does not re-read every file
+digest_cache = ExpiringLRUCache(4096)
+
+
+def media_root():
+    return Path(settings.MEDIA_ROOT)
+
+def source_path(image):
+    """
+    Path, relative to MEDIA_ROOT, of the local image an image column
+    refers to ("product_image/a.png", "/media/product_image/a.png"), or
+    None for remote URLs and files that do not exist.
+    """
+    if not image or '://' in image:
+        return None
+    name = image.lstrip('/')
+    media_url = settings.MEDIA_URL.lstrip('/')
+    if name.startswith(media_url):
+        name = name[len(media_url):]
+    if not name.lower().endswith(SOURCE_EXTENSIONS) or name.startswith(DERIVATIVE_DIR + '/'):
+        return None
+    root = media_root().resolve()
+    path = (root / name).resolve()
+    if root not in path.parents or not path.is_file():
+        return None
+    return path.relative_to(root).as_posix()
+
+def content_digest(name):
+    path = media_root() / name
+    stat = path.stat()
+    key = (name, stat.st_mtime_ns, stat.st_size)
+    digest = digest_cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(64 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()[:DIGEST_LENGTH]
+        digest_cache.set(key, digest)
+    return digest
+
+def fallback_extension(name):
+    return 'png' if name.lower().endswith('.png') else 'jpg'
+
+def derivative_name(name, digest, size, ext):
+    return f'{DERIVATIVE_DIR}/{name}.{digest}-{size}.{ext}'
+
+def media_url(name):
+    return '/' + settings.MEDIA_URL.lstrip('/') + name
+
+def derivative_urls(image):
+    """
+    URLs of the derivatives of a local image, by size and format:
+    {'thumb': {'width': 160, 'webp': url, 'jpg': url}, ...}. None for
+    images that are not under MEDIA_ROOT. The files themselves are built
+    on their first request (or by the build_image_derivatives command).
+    """
+    name = source_path(image)
+    if name is None:
+        return None
+    digest = content_digest(name)
+    fallback = fallback_extension(name)
+    return {
+        size: {
+            'width': width,
+            'webp': media_url(derivative_name(name, digest, size, 'webp')),
+            fallback: media_url(derivative_name(name, digest, size, fallback)),
+        }
+        for size, width in DERIVATIVE_SIZES.items()
+    }
+
+def parse_derivative(derivative):
+    """
+    Split a derivative path (relative to MEDIA_ROOT/DERIVATIVE_DIR) into
+    (source, digest, size, ext), or None when it is not one.
+    """
+    match = DERIVATIVE_RE.match(derivative)
+    if match is None or match['size'] not in DERIVATIVE_SIZES:
+        return None
+    if match['ext'] != 'webp' and match['ext'] != fallback_extension(match['source']):
+        return None
+    return match['source'], match['digest'], match['size'], match['ext']
+
+def render(source, width, ext):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, width * 10), Image.LANCZOS)
+        if ext == 'jpg' and image.mode != 'RGB':
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            image = image.convert('RGBA')
+        return image.copy()
+
+def build_derivative(name, size, ext):
+    """
+    Build one derivative of the local image name unless it already
+    exists, returns its path relative to MEDIA_ROOT. The file is written
+    to a temporary name first so a concurrent reader never sees half of it.
+    """
+    digest = content_digest(name)
+    target_name = derivative_name(name, digest, size, ext)
+    target = media_root() / target_name
+    if target.exists():
+        return target_name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    image = render(media_root() / name, DERIVATIVE_SIZES[size], ext)
+    descriptor, temporary = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            image.save(output, **SAVE_OPTIONS[ext])
+        os.replace(temporary, target)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return target_name
+
+def build_requested_derivative(derivative):
+    """
+    Build the derivative a client asked for by URL, returns its path
+    relative to MEDIA_ROOT or None when the name does not match the
+    current content of an existing source image.
+    """
+    parsed = parse_derivative(derivative)
+    if parsed is None:
+        return None
+    source, digest, size, ext = parsed
+    name = source_path(source)
+    if name is None or content_digest(name) != digest:
+        return None
+    return build_derivative(name, size, ext)
+
+def build_all_derivatives(name):
+    fallback = fallback_extension(name)
+    return [
+        build_derivative(name, size, ext)
+        for size in DERIVATIVE_SIZES
+        for ext in ('webp', fallback)
+    ]
+
+def iter_source_images(directories=None):
+    root = media_root()
+    for directory in directories or SOURCE_DIRS:
+        for path in sorted((root / directory).rglob('*')):
+            if path.is_file() and path.suffix.lower() in SOURCE_EXTENSIONS:
+                yield path.relative_to(root).as_posix()
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import F
+from django.utils.deprecation import MiddlewareMixin
+from .models import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+
+def _initial_version():
+    # Start from a clock value so a namespace whose row was lost never goes
+    # back to a version that shared cache entries were stored under.
+    return int(time.time() * 1000)
+
+
+class InvalidationBus:
+    """
+    Cache invalidation shared by every worker process through the
+    CacheVersion table. A writer publishes a namespace, which bumps its
+    row; each process polls the table (InvalidationMiddleware does it at
+    most every CACHE_INVALIDATION_POLL_INTERVAL seconds, one small query)
+    and calls the subscribers of every namespace that moved on.
+
+    Subscribers are called for changes made by other processes only: the
+    process that published a change updates its own caches itself.
+    """
+    def __init__(self):
+        self._versions = {}
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+        self._last_poll = None
+
+    def subscribe(self, namespace, callback):
+        """
+        Call callback() whenever another process publishes namespace.
+        """
+        with self._lock:
+            self._subscribers[namespace].append(callback)
+
+    def _notify(self, namespaces):
+        for namespace in namespaces:
+            for callback in list(self._subscribers[namespace]):
+                try:
+                    callback()
+                except Exception:
+                    logger.exception('Cache invalidation callback for %s failed', namespace)
+
+    def poll(self, force=False):
+        """
+        Read every namespace version, unless the last poll is more recent
+        than CACHE_INVALIDATION_POLL_INTERVAL seconds and force is False.
+        Returns the namespaces that changed.
+        """
+        interval = getattr(settings, 'CACHE_INVALIDATION_POLL_INTERVAL', 1.0)
+        now = time.monotonic()
+        if not force and self._last_poll is not None and now - self._last_poll < interval:
+            return []
+        versions = dict(CacheVersion.objects.values_list('namespace', 'version'))
+        with self._lock:
+            self._last_poll = now
+            changed = [
+                namespace for namespace, version in versions.items()
+                if self._versions.get(namespace, 0) != version
+            ]
+            self._versions.update(versions)
+        self._notify(changed)
+        return changed
+
+    def version(self, namespace):
+        """
+        Version of namespace as of the last poll, 0 until it is first published.
+        """
+        if self._last_poll is None:
+            self.poll(force=True)
+        return self._versions.get(namespace, 0)
+
+    def publish(self, namespace):
+        """
+        Bump the version of namespace and return it. This process uses the
+        new version right away, the others once it is committed.
+        """
+        updated = CacheVersion.objects.filter(namespace=namespace).update(version=F('version') + 1)
+        if updated == 0:
+            CacheVersion.objects.bulk_create(
+                [CacheVersion(namespace=namespace, version=_initial_version())],
+                ignore_conflicts=True
+            )
+            CacheVersion.objects.filter(namespace=namespace).update(version=F('version') + 1)
+        version = CacheVersion.objects.get(namespace=namespace).version
+        with self._lock:
+            previous = self._versions.get(namespace)
+            self._versions[namespace] = version
+        # Another process published in between: its change is ours to apply
+        if previous is not None and previous != version - 1:
+            self._notify([namespace])
+        return version
+
+    def reset(self):
+        """
+        Forget every known version, the next lookup reads them again.
+        """
+        with self._lock:
+            self._versions = {}
+            self._last_poll = None
+
+invalidation_bus = InvalidationBus()
+
+
+class InvalidationMiddleware(MiddlewareMixin):
+    """
+    Poll the invalidation bus before each request is handled, except
+    media files, which no cache is involved in. Being a MiddlewareMixin,
+    it also runs in front of async views without turning the rest of the
+    chain synchronous.
+    """
+    def process_request(self, request):
+        if request.path.startswith('/' + settings.MEDIA_URL.lstrip('/')):
+            return
+        invalidation_bus.poll()
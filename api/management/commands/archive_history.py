@@ -0,0 +1,49 @@
+import json
+import re
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.archive import archive_history, iter_archive, restore_archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move History rows older than the retention window into monthly '
+        'gzipped NDJSON archives, or stream/restore an archived month'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'HISTORY_RETENTION_DAYS', 180),
+            help='Archive rows older than this many days',
+        )
+        parser.add_argument('--dir', help='Archive directory, defaults to HISTORY_ARCHIVE_DIR')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dump', metavar='YYYY-MM', help='Write the archived rows of a month to stdout')
+        parser.add_argument('--restore', metavar='YYYY-MM', help='Insert the archived rows of a month back into History')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir']) if options['dir'] else None
+        month = options['dump'] or options['restore']
+        if month is not None and re.fullmatch(r'\d{4}-\d{2}', month) is None:
+            raise CommandError('Month must be in YYYY-MM format')
+
+        if options['dump']:
+            for row in iter_archive(month, directory):
+                self.stdout.write(json.dumps(row, ensure_ascii=False))
+            return
+
+        if options['restore']:
+            count = restore_archive(month, directory, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Restored {count} history rows of {month}'))
+            return
+
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        before = timezone.now() - timedelta(days=options['days'])
+        count = archive_history(before, directory, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} history rows created before {before:%Y-%m-%d}'))
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.utils import timezone
+from api.benchmarks import benchmark_database, summarize
+from api.models import Category, Coupon, Product, User
+
+
+@contextmanager
+def database_latency(seconds):
+    """
+    Add seconds of latency to every query, on every connection opened
+    meanwhile, as a database on another host would.
+    """
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install)
+    install(connection)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        connection.execute_wrappers.remove(delay)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests per second and latency of the sync catalog views, '
+        'served one at a time like a sync worker, with their async versions '
+        'under concurrent load and simulated database latency, on a throwaway database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view kind')
+        parser.add_argument('--concurrency', type=int, default=16, help='Clients sending requests at the same time')
+        parser.add_argument('--latency', type=float, default=20, help='Milliseconds added to every query')
+
+    def handle(self, *args, **options):
+        requests, concurrency = options['requests'], options['concurrency']
+        if requests < 1 or concurrency < 1 or options['latency'] < 0:
+            raise CommandError('--requests and --concurrency must be positive, --latency not negative')
+        with benchmark_database():
+            user = User.objects.create(username='benchmark', email='benchmark@example.com')
+            category = Category.objects.create(name='Burger', _creator=user, _updater=user)
+            products = Product.objects.bulk_create([
+                Product(name=f'Burger {index}', price=10000, category=category, _creator=user, _updater=user)
+                for index in range(20)
+            ])
+            Coupon.objects.create(code='BENCHMARK', name='Benchmark', discount=10, expiry_date=timezone.now() + timedelta(days=1))
+            paths = [
+                'product',
+                f'product/{products[0].id}',
+                f'product/{products[0].id}/review',
+                f'category/detail/{category.id}',
+                'coupon/BENCHMARK',
+            ]
+
+            with database_latency(options['latency'] / 1000):
+                sync_client = Client()
+                # thread_sensitive: every request runs in the same thread, one at a time
+                sync_get = sync_to_async(sync_client.get, thread_sensitive=True)
+                async_client = AsyncClient()
+                for label, get, prefix in (
+                    ('sync, one worker', sync_get, '/api/'),
+                    ('async', async_client.get, '/api/async/'),
+                ):
+                    timings, elapsed = asyncio.run(self.load(get, [prefix + path for path in paths], requests, concurrency))
+                    summary = summarize(timings)
+                    self.stdout.write(
+                        f'{label:<20} {len(timings) / elapsed:8.1f} requests/s'
+                        f'  p50 {summary["p50"]:8.2f} ms  p99 {summary["p99"]:8.2f} ms'
+                    )
+
+    async def load(self, get, urls, requests, concurrency):
+        """
+        Send requests GETs from concurrency clients, each sending its next
+        request once the previous one is answered. Returns the latency of
+        every request and the elapsed time.
+        """
+        queue = [urls[index % len(urls)] for index in range(requests)]
+        timings = []
+
+        async def client():
+            while queue:
+                url = queue.pop()
+                start = time.perf_counter()
+                response = await get(url)
+                timings.append(time.perf_counter() - start)
+                if not 200 <= response.status_code < 300:
+                    raise CommandError(f'{url} answered {response.status_code}')
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return timings, time.perf_counter() - start
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.benchmarks import benchmark_database, format_timings, measure
+from api.models import Category, Product, User
+from api.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare fetching product listing pages with OFFSET and with the '
+        'keyset condition KeysetPagination uses, at several depths, on a '
+        'throwaway database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Products to create')
+        parser.add_argument('--page-size', type=int, default=KeysetPagination.page_size)
+        parser.add_argument('--repeat', type=int, default=50, help='Fetches per depth and method')
+
+    def handle(self, *args, **options):
+        rows, page_size = options['rows'], options['page_size']
+        if rows < page_size or page_size < 1:
+            raise CommandError('--rows must be at least --page-size, which must be positive')
+        with benchmark_database():
+            user = User.objects.create(username='benchmark', email='benchmark@example.com')
+            category = Category.objects.create(name='Benchmark', _creator=user, _updater=user)
+            Product.objects.bulk_create(
+                [
+                    Product(name=f'Product {index}', category=category, _creator=user, _updater=user)
+                    for index in range(rows)
+                ],
+                batch_size=1000
+            )
+            # bulk_create stamps every row with the same _created, spread them out
+            products = list(Product.objects.only('id'))
+            start = timezone.now() - timedelta(seconds=rows)
+            for product in products:
+                product._created = start + timedelta(seconds=product.id)
+            Product.objects.bulk_update(products, ['_created'], batch_size=1000)
+            products = Product.objects.order_by('-_created', '-id')
+
+            for depth in (0.0, 0.1, 0.5, 0.9):
+                offset = min(int(rows * depth), rows - page_size)
+                self.stdout.write(f'page at row {offset}:')
+
+                def offset_page():
+                    return list(products[offset:offset + page_size])
+
+                # The cursor of the previous page holds the _created of its last row,
+                # CursorPagination turns it into this range condition
+                boundary = products[offset - 1] if offset > 0 else None
+
+                def keyset_page():
+                    page = products
+                    if boundary is not None:
+                        page = page.filter(_created__lt=boundary._created)
+                    return list(page[:page_size])
+
+                if [product.id for product in offset_page()] != [product.id for product in keyset_page()]:
+                    raise CommandError(f'OFFSET and keyset pages differ at row {offset}')
+                self.stdout.write('  ' + format_timings('OFFSET', measure(offset_page, options['repeat'])))
+                self.stdout.write('  ' + format_timings('keyset', measure(keyset_page, options['repeat'])))
@@ -0,0 +1,81 @@
+import random
+import time
+from functools import reduce
+from operator import and_
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from api.benchmarks import benchmark_database, format_timings, measure
+from api.models import Category, Product, User
+from api.search import ProductSearchIndex
+
+DISHES = ('Burger', 'Cơm', 'Phở', 'Bún', 'Bánh', 'Trà', 'Cà phê', 'Gà rán', 'Mì', 'Xôi')
+# Vietnamese words are single syllables, these make a vocabulary of a few hundred
+ONSETS = ('b', 'c', 'ch', 'd', 'đ', 'g', 'h', 'kh', 'l', 'm', 'n', 'ng', 'nh', 'ph', 'qu', 'r', 's', 't', 'th', 'tr', 'v', 'x')
+RHYMES = (
+    'a', 'à', 'á', 'ai', 'am', 'an', 'ang', 'anh', 'ao', 'ay', 'e', 'em', 'en', 'eo', 'ê',
+    'i', 'im', 'in', 'inh', 'o', 'oa', 'oi', 'om', 'on', 'ong', 'ô', 'ôi', 'ơ', 'u', 'ua',
+    'ui', 'ung', 'ư', 'ưa', 'ương',
+)
+SYLLABLES = tuple(onset + rhyme for onset in ONSETS for rhyme in RHYMES)
+
+QUERIES = ('ga ran quay', 'bun cha', 'pho bo', 'com tam suon', 'trà đào', 'c')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare product search through the in-memory index with the '
+        'icontains queries it replaces, on a throwaway database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Products to create')
+        parser.add_argument('--repeat', type=int, default=20, help='Searches per query and method')
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rows, limit = options['rows'], options['limit']
+        if rows < 1 or limit < 1:
+            raise CommandError('--rows and --limit must be positive')
+        randomizer = random.Random(0)
+        with benchmark_database():
+            user = User.objects.create(username='benchmark', email='benchmark@example.com')
+            categories = [
+                Category.objects.create(name=dish, _creator=user, _updater=user)
+                for dish in DISHES
+            ]
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        name=' '.join([category.name] + randomizer.sample(SYLLABLES, 2)),
+                        description=' '.join(randomizer.sample(SYLLABLES, 12)),
+                        category=category,
+                        _creator=user,
+                        _updater=user,
+                    )
+                    for category in (randomizer.choice(categories) for _ in range(rows))
+                ],
+                batch_size=1000
+            )
+
+            index = ProductSearchIndex()
+            start = time.perf_counter()
+            index.build()
+            self.stdout.write(f'index built from {rows} products in {time.perf_counter() - start:.2f} s')
+
+            for query in QUERIES:
+                self.stdout.write(f'query "{query}":')
+                # Without the index: every word in any of the fields, which
+                # unlike the index neither folds diacritics nor ranks
+                condition = reduce(and_, (
+                    Q(name__icontains=word) | Q(category__name__icontains=word) | Q(description__icontains=word)
+                    for word in query.split()
+                ))
+
+                def icontains_search():
+                    return list(Product.objects.filter(condition).values_list('id', flat=True)[:limit])
+
+                def index_search():
+                    return index.search(query, limit)
+
+                self.stdout.write('  ' + format_timings('icontains', measure(icontains_search, options['repeat'])))
+                self.stdout.write('  ' + format_timings('index', measure(index_search, options['repeat'])))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from PIL import Image, UnidentifiedImageError
+from api.images import build_all_derivatives, iter_source_images
+
+
+class Command(BaseCommand):
+    help = 'Build the resized and WebP derivatives of every image under IMAGE_SOURCE_DIRS'
+
+    def handle(self, *args, **options):
+        images = 0
+        derivatives = 0
+        for name in iter_source_images():
+            try:
+                derivatives += len(build_all_derivatives(name))
+                images += 1
+            except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as error:
+                self.stderr.write(f'Skipped {name}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'Built {derivatives} derivatives of {images} images'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from api.cache import bump_catalog_version
+from api.models import Category, Product
+from api.placeholders import PLACEHOLDER_FIELDS, refresh_image_placeholder
+
+
+class Command(BaseCommand):
+    help = 'Compute the image placeholders (blurhash, dominant colour, size) of products and categories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute placeholders that are already set')
+
+    def handle(self, *args, **options):
+        refreshed = 0
+        for model in (Product, Category):
+            rows = model.all_objects.exclude(image=None).exclude(image='').only('id', 'image', *PLACEHOLDER_FIELDS)
+            if not options['all']:
+                rows = rows.filter(image_placeholder=None)
+            for instance in rows.iterator():
+                if refresh_image_placeholder(instance)['image_placeholder'] is not None:
+                    refreshed += 1
+        if refreshed > 0:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Computed {refreshed} image placeholders'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.uploads import merge_duplicates
+
+
+class Command(BaseCommand):
+    help = 'Merge media files with identical content and repoint the image columns at the one kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+
+    def handle(self, *args, **options):
+        groups, removed, reclaimed, updated = merge_duplicates(dry_run=options['dry_run'])
+        action = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {removed} duplicate files in {groups} groups, '
+            f'{reclaimed} bytes, {updated} rows updated'
+        ))
@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from api.sales import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = 'Backfill or repair the DailySales rollup from the Order table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First date to rebuild (YYYY-MM-DD), defaults to the first order')
+        parser.add_argument('--end', help='Last date to rebuild (YYYY-MM-DD), defaults to the last order')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('--start and --end must be dates in YYYY-MM-DD format')
+        count = rebuild_daily_sales(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollup of {count} days'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.ratings import rebuild_product_ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-product review summaries from approved reviews'
+
+    def handle(self, *args, **options):
+        count = rebuild_product_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating summaries of {count} products'))
@@ -0,0 +1,152 @@
+import mimetypes
+import os
+import re
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from PIL import Image
+from .images import build_requested_derivative, parse_derivative
+from .uploads import upload_digest
+
+ACCEL_REDIRECT = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+ACCEL_REDIRECT_PREFIX = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+CACHE_SECONDS = getattr(settings, 'MEDIA_CACHE_SECONDS', 3600)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_digest_of_name(name):
+    """
+    Digest embedded in a content-addressed media name, or None. Such
+    files never change, so their digest is a strong ETag and they can
+    be cached for good.
+    """
+    derivative_dir = settings.IMAGE_DERIVATIVE_DIR + '/'
+    if name.startswith(derivative_dir):
+        parsed = parse_derivative(name[len(derivative_dir):])
+        if parsed is not None:
+            return f'{parsed[1]}-{parsed[2]}'
+    return upload_digest(name)
+
+def parse_range(header, size):
+    """
+    (start, end) of a single byte range header, end included. None when
+    the header is not one range we serve partially, 'unsatisfiable' when
+    the range lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None or match[1] == match[2] == '':
+        return None
+    if match[1] == '':
+        length = int(match[2])
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(match[1])
+    if start >= size:
+        return 'unsatisfiable'
+    end = int(match[2]) if match[2] else size - 1
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def iter_file_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+def accel_response(name, path):
+    response = HttpResponse()
+    if ACCEL_REDIRECT == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX + name
+    else:
+        response['X-Sendfile'] = str(path)
+    # Let the proxy fill in the type of the file it sends
+    del response['Content-Type']
+    return response
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file of MEDIA_ROOT with validators and cache headers: a
+    strong ETag, 304 answers to If-None-Match, single byte ranges, and a
+    year of immutable caching for content-addressed names. With
+    MEDIA_ACCEL_REDIRECT set, the file itself is sent by the front proxy.
+    """
+    try:
+        full_path = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('Media not found')
+    if not full_path.is_file():
+        raise Http404('Media not found')
+    name = full_path.relative_to(os.path.abspath(settings.MEDIA_ROOT)).as_posix()
+    stat = full_path.stat()
+
+    digest = content_digest_of_name(name)
+    if digest is not None:
+        etag = f'"{digest}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        cache_control = f'public, max-age={CACHE_SECONDS}'
+
+    def with_validators(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return with_validators(not_modified)
+
+    if ACCEL_REDIRECT:
+        return with_validators(accel_response(name, full_path))
+
+    content_type = mimetypes.guess_type(str(full_path))[0] or 'application/octet-stream'
+    size = stat.st_size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(full_path, start, end - start + 1),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    return with_validators(response)
+
+@require_safe
+def serve_derivative(request, derivative):
+    """
+    Serve an image derivative, building it on its first request.
+    """
+    try:
+        name = build_requested_derivative(derivative)
+    except Image.DecompressionBombError:
+        name = None
+    if name is None:
+        raise Http404('Image not found')
+    return serve_media(request, name)
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_couponusage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['_created', 'id'], name='api_categor__create_1cad17_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['_created', 'id'], name='api_product__create_346411_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '_created', 'id'], name='api_product_categor_457025_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_productrating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_status', '_created'], name='api_order_order_s_b9aed1_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_order_status_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.FloatField(default=0.0)),
+                ('order_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('done_count', models.IntegerField(default=0)),
+                ('units_sold', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_dailysales'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='history',
+            name='_created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_history_created_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['_creator', '_created'], name='api_history__creato_b2fbba_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_history_creator_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['_created', 'id'], name='api_order__create_b06122_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_method', '_created'], name='api_order_payment_c01ec1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '_created'], name='api_order_user_id_f5ba22_idx'),
+        ),
+    ]
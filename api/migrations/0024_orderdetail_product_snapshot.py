@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:27
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_product_snapshot(apps, schema_editor):
+    OrderDetail = apps.get_model('api', 'OrderDetail')
+    Product = apps.get_model('api', 'Product')
+    product = Product.objects.filter(id=OuterRef('product'))
+    OrderDetail.objects.update(
+        name=Subquery(product.values('name')[:1]),
+        image=Subquery(product.values('image')[:1]),
+        price=Subquery(product.values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_order_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderdetail',
+            name='image',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderdetail',
+            name='name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderdetail',
+            name='price',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(copy_product_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_orderdetail_product_snapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='category',
+            name='api_categor__create_1cad17_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='api_product__create_346411_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='api_product_categor_457025_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['_creator', '_deleted', 'product'], name='api_cart__creato_dd71f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['_deleted', '_created', 'id'], name='api_categor__delete_9c8519_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoriteproduct',
+            index=models.Index(fields=['_creator', '_deleted'], name='api_favorit__creato_b519c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoriteproduct',
+            index=models.Index(fields=['product', '_deleted'], name='api_favorit_product_ebcef4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['_deleted', '_created', 'id'], name='api_product__delete_573471_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '_deleted', '_created', 'id'], name='api_product_categor_671919_idx'),
+        ),
+    ]
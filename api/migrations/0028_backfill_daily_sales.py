@@ -0,0 +1,57 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:40
+
+from collections import defaultdict
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+ROLLUP_FIELDS = ('revenue', 'order_count', 'pending_count', 'done_count', 'units_sold')
+
+
+def backfill_daily_sales(apps, schema_editor):
+    # The stats and revenue endpoints read only the rollup. Same totals as
+    # api.sales.rebuild_daily_sales, kept here so later changes to it do
+    # not change what this migration does.
+    Order = apps.get_model('api', 'Order')
+    OrderDetail = apps.get_model('api', 'OrderDetail')
+    DailySales = apps.get_model('api', 'DailySales')
+    tz = timezone.get_current_timezone()
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    rows = Order.objects.annotate(
+        day=TruncDay('_created', tzinfo=tz)
+    ).values('day').annotate(
+        order_count=Count('id'),
+        pending_count=Count('id', filter=Q(order_status='PENDING')),
+        done_count=Count('id', filter=Q(order_status='DONE')),
+        revenue=Sum('price', filter=Q(order_status='DONE')),
+    ).order_by()
+    for row in rows:
+        day = timezone.localtime(row['day'], tz).date()
+        totals[day]['order_count'] = row['order_count']
+        totals[day]['pending_count'] = row['pending_count']
+        totals[day]['done_count'] = row['done_count']
+        totals[day]['revenue'] = row['revenue'] or 0
+    units = OrderDetail.objects.annotate(
+        day=TruncDay('order___created', tzinfo=tz)
+    ).values('day').annotate(units_sold=Sum('quantity')).order_by()
+    for row in units:
+        day = timezone.localtime(row['day'], tz).date()
+        totals[day]['units_sold'] = row['units_sold'] or 0
+
+    DailySales.objects.all().delete()
+    DailySales.objects.bulk_create(
+        [DailySales(date=day, **values) for day, values in totals.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
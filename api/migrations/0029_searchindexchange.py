@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_backfill_daily_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.IntegerField(blank=True, null=True)),
+                ('category_id', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
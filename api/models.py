@@ -1,8 +1,43 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 # Create your models here.
 # TODO: coupon model
 
+class SoftDeleteQuerySet(models.QuerySet):
+    def live(self):
+        return self.filter(_deleted=None)
+
+    def deleted(self):
+        return self.exclude(_deleted=None)
+
+    def soft_delete(self, **fields):
+        """
+        Mark every live row of the queryset deleted with one UPDATE,
+        returns the number of rows deleted.
+        """
+        now = timezone.now()
+        if hasattr(self.model, '_updated'):
+            fields.setdefault('_updated', now)
+        return self.live().update(_deleted=now, **fields)
+
+    def restore(self, **fields):
+        """
+        Undo soft_delete() for every deleted row of the queryset,
+        returns the number of rows restored.
+        """
+        if hasattr(self.model, '_updated'):
+            fields.setdefault('_updated', timezone.now())
+        return self.deleted().update(_deleted=None, **fields)
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    Default manager of the soft deleted models, hides deleted rows.
+    Use Model.all_objects to reach them.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(_deleted=None)
+
 class User(AbstractUser):
     name = models.CharField(max_length=255, null=True, blank=True)
     email = models.CharField(max_length=255, unique=True)
@@ -26,6 +61,19 @@ class Category(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     image = models.CharField(max_length=500, null=True, blank=True)
+    # Computed from image by api.placeholders
+    image_placeholder = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, null=True, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['_deleted', '_created', 'id']),
+        ]
 
     def __str__(self):
         return self.name
@@ -38,6 +86,11 @@ class Product(models.Model):
     _deleted = models.DateTimeField(null=True, blank=True)
     name = models.CharField(max_length=255)
     image = models.CharField(max_length=500, null=True, blank=True)
+    # Computed from image by api.placeholders
+    image_placeholder = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, null=True, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     price = models.FloatField(default=0.0)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='category_fk')
     description = models.TextField(null=True, blank=True)
@@ -48,6 +101,15 @@ class Product(models.Model):
     ]
     status = models.CharField(max_length=10, choices=PRODUCT_STATUS, default="E")
 
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['_deleted', '_created', 'id']),
+            models.Index(fields=['category', '_deleted', '_created', 'id']),
+        ]
+
     def __str__(self):
         return self.name + ', id ' + str(self.id)
 
@@ -72,9 +134,52 @@ class Order(models.Model):
     address = models.TextField(null=True, blank=True)
     note = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['_created', 'id']),
+            models.Index(fields=['order_status', '_created']),
+            models.Index(fields=['payment_method', '_created']),
+            models.Index(fields=['user', '_created']),
+        ]
+
     def __str__(self):
         return "Order id {id}".format(id=self.id)
 
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    revenue = models.FloatField(default=0.0)
+    order_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    done_count = models.IntegerField(default=0)
+    units_sold = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'Sales of {self.date}'
+
+class CacheVersion(models.Model):
+    """
+    Version counter of a cache namespace, shared by every worker process
+    through the database. See api.invalidation.
+    """
+    namespace = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.namespace} v{self.version}'
+
+class SearchIndexChange(models.Model):
+    """
+    A product or category whose search index entries changed, replayed by
+    the other worker processes on their own index. See api.search.
+    """
+    product_id = models.IntegerField(null=True, blank=True)
+    category_id = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        if self.product_id is not None:
+            return f'Search change {self.id}: product {self.product_id}'
+        return f'Search change {self.id}: category {self.category_id}'
+
 class Review(models.Model):
     _created = models.DateTimeField(auto_now_add=True)
     _creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='review_creator')
@@ -93,6 +198,25 @@ class Review(models.Model):
     def __str__(self):
         return "Review id {review_id} of order id {order_id}".format(review_id=self.id, order_id=self.order.id)
 
+class ProductRating(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    star_1 = models.IntegerField(default=0)
+    star_2 = models.IntegerField(default=0)
+    star_3 = models.IntegerField(default=0)
+    star_4 = models.IntegerField(default=0)
+    star_5 = models.IntegerField(default=0)
+
+    @property
+    def average(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def __str__(self):
+        return f'Rating of product id {self.product_id}, {self.count} reviews'
+
 class OrderDetail(models.Model):
     _created = models.DateTimeField(auto_now_add=True)
     _creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='detail_creator')
@@ -102,6 +226,10 @@ class OrderDetail(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_product_details')
     quantity = models.IntegerField()
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='detail_order_fk')
+    # Product name, image and unit price captured at checkout
+    name = models.CharField(max_length=255, null=True, blank=True)
+    image = models.CharField(max_length=500, null=True, blank=True)
+    price = models.FloatField(default=0.0)
     
     def __str__(self):
         return 'Order detail id {id} of order id {order_id} for product id {product_id}'.format(id=self.id, order_id=self.order, product_id=self.product.id)
@@ -115,14 +243,28 @@ class Cart(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_item')
     quantity = models.IntegerField(default=1)
 
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['_creator', '_deleted', 'product']),
+        ]
+
     def __str__(self):
         return f'Cart item id {self.product.id}, user id {self._creator.id}, quantity {self.quantity}'
 
 class History(models.Model):
-    _created = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: entries are written in batches after the event happened
+    _created = models.DateTimeField(default=timezone.now)
     _creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='history_creator')
     message = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['_creator', '_created']),
+        ]
+
 class Coupon(models.Model):
     discount = models.IntegerField(default=0)
     name = models.CharField(max_length=1024)
@@ -138,4 +280,13 @@ class FavoriteProduct(models.Model):
     _created = models.DateTimeField(auto_now_add=True)
     _creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorite_product_creator')
     _deleted = models.DateTimeField(blank=True, null=True)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='favorite_product_fk')
\ No newline at end of file
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='favorite_product_fk')
+
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['_creator', '_deleted']),
+            models.Index(fields=['product', '_deleted']),
+        ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination ordered by (_created, id), newest first.
+    The cursor is opaque to clients and each page is fetched with a
+    range condition on the ordering columns instead of an OFFSET.
+    """
+    ordering = ('-_created', '-id')
+    page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    ordering_query_param = 'ordering'
+    # ?ordering= values a view accepts, mapped to their full keyset ordering
+    allowed_orderings = {}
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_ordering(self, request, queryset, view):
+        requested = request.query_params.get(self.ordering_query_param, None)
+        return self.allowed_orderings.get(requested, self.ordering)
+
+
+class OrderPagination(KeysetPagination):
+    allowed_orderings = {
+        '-_created': ('-_created', '-id'),
+        '_created': ('_created', 'id'),
+    }
+
+
+def paginated_response(request, queryset, serializer_class, view=None, paginator_class=KeysetPagination):
+    """
+    Return a paginated response when the client asked for a page
+    (``?page_size=`` or ``?cursor=``), otherwise None so the caller can
+    fall back to the full listing.
+    """
+    paginator = paginator_class()
+    if not paginator.is_requested(request):
+        return None
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    serializer = serializer_class(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,129 @@
+import math
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .images import media_root, source_path
+
+COMPONENTS = getattr(settings, 'IMAGE_PLACEHOLDER_COMPONENTS', (4, 3))
+# Blurhash is computed on a copy this small, its components are that smooth anyway
+SAMPLE_SIZE = 32
+EXIF_ORIENTATION = 0x0112
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+PLACEHOLDER_FIELDS = ('image_placeholder', 'image_color', 'image_width', 'image_height')
+
+
+def encode83(value, length):
+    return ''.join(BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+def srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+def linear_to_srgb(value):
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+def sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+def blurhash(image, x_components=4, y_components=3):
+    """
+    Blurhash (https://blurha.sh) of an RGB image, which any blurhash
+    decoder turns back into a blurred preview.
+    """
+    width, height = image.size
+    pixels = [tuple(srgb_to_linear(channel) for channel in pixel) for pixel in image.getdata()]
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            normalisation = 1 if i == 0 and j == 0 else 2
+            red = green = blue = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pixel = pixels[row + x]
+                    red += basis * pixel[0]
+                    green += basis * pixel[1]
+                    blue += basis * pixel[2]
+            scale = normalisation / (width * height)
+            factors.append((red * scale, green * scale, blue * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = encode83(x_components - 1 + (y_components - 1) * 9, 1)
+    if len(ac) > 0:
+        quantised_max = max(0, min(82, int(max(abs(value) for factor in ac for value in factor) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        result += encode83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += encode83(0, 1)
+    result += encode83(
+        (linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]),
+        4
+    )
+    for factor in ac:
+        red, green, blue = (
+            max(0, min(18, int(sign_pow(value / maximum, 0.5) * 9 + 9.5)))
+            for value in factor
+        )
+        result += encode83(red * 19 * 19 + green * 19 + blue, 2)
+    return result
+
+def dominant_color(image):
+    """
+    Most common colour of an RGB image once reduced to a few, as #rrggbb.
+    """
+    quantized = image.quantize(colors=5)
+    count, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+def image_placeholder(image):
+    """
+    Placeholder fields of an image column value: blurhash, dominant
+    colour and displayed size. None for remote URLs, missing files,
+    files that are not images and images Pillow refuses to decode as
+    decompression bombs.
+    """
+    name = source_path(image)
+    if name is None:
+        return None
+    try:
+        with Image.open(media_root() / name) as source:
+            width, height = source.size
+            if source.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width
+            # Lets JPEG decode at a fraction of its size
+            source.draft('RGB', (SAMPLE_SIZE, SAMPLE_SIZE))
+            sample = ImageOps.exif_transpose(source)
+            sample.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+            sample = sample.convert('RGBA')
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        return None
+    background = Image.new('RGB', sample.size, (255, 255, 255))
+    background.paste(sample, mask=sample.getchannel('A'))
+    return {
+        'image_placeholder': blurhash(background, *COMPONENTS),
+        'image_color': dominant_color(background),
+        'image_width': width,
+        'image_height': height,
+    }
+
+def refresh_image_placeholder(instance):
+    """
+    Recompute the placeholder fields of a Product or Category from its
+    image and store them without touching the other columns.
+    """
+    values = image_placeholder(instance.image) or dict.fromkeys(PLACEHOLDER_FIELDS)
+    if all(getattr(instance, field) == value for field, value in values.items()):
+        return values
+    for field, value in values.items():
+        setattr(instance, field, value)
+    type(instance)._base_manager.filter(pk=instance.pk).update(**values)
+    return values
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
+from .cache import bump_catalog_version
+from .models import OrderDetail, ProductRating
+
+APPROVED = 'APPROVE'
+
+
+def star_field(rating):
+    """
+    Name of the histogram column a rating falls into, ratings are rounded
+    half up and clamped to 1..5.
+    """
+    star = min(max(int(float(rating) + 0.5), 1), 5)
+    return f'star_{star}'
+
+def _apply_rating(order_id, rating, sign):
+    product_ids = list(
+        OrderDetail.objects.filter(order=order_id).values_list('product', flat=True).distinct()
+    )
+    if len(product_ids) == 0:
+        return
+    ProductRating.objects.bulk_create(
+        [ProductRating(product_id=product_id) for product_id in product_ids],
+        ignore_conflicts=True
+    )
+    field = star_field(rating)
+    ProductRating.objects.filter(product__in=product_ids).update(
+        count=F('count') + sign,
+        total=F('total') + sign * float(rating),
+        **{field: F(field) + sign}
+    )
+    # Cached catalog responses embed the rating (ProductSerializer.rating)
+    transaction.on_commit(bump_catalog_version)
+
+def add_review(review):
+    """
+    Count an approved review in the summary of every product of its order.
+    """
+    if review.status == APPROVED:
+        _apply_rating(review.order_id, review.rating, 1)
+
+def update_review(review, old_status, old_rating):
+    """
+    Move a review's contribution after its status or rating changed.
+    """
+    if old_status == review.status and float(old_rating) == float(review.rating):
+        return
+    if old_status == APPROVED:
+        _apply_rating(review.order_id, old_rating, -1)
+    if review.status == APPROVED:
+        _apply_rating(review.order_id, review.rating, 1)
+
+def rebuild_product_ratings():
+    """
+    Recompute every product summary from the approved reviews.
+    Returns the number of products with at least one review.
+    """
+    summaries = defaultdict(ProductRating)
+    rows = OrderDetail.objects.filter(
+        order__review_order_fk__status=APPROVED
+    ).values_list(
+        'product',
+        'order__review_order_fk__id',
+        'order__review_order_fk__rating',
+    ).distinct()
+    for product_id, review_id, rating in rows.iterator():
+        summary = summaries[product_id]
+        summary.product_id = product_id
+        summary.count += 1
+        summary.total += rating
+        field = star_field(rating)
+        setattr(summary, field, getattr(summary, field) + 1)
+
+    with transaction.atomic():
+        ProductRating.objects.all().delete()
+        ProductRating.objects.bulk_create(summaries.values(), batch_size=1000)
+        transaction.on_commit(bump_catalog_version)
+    return len(summaries)
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from .models import DailySales
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+BUCKET_DAYS = {
+    'day': 1,
+    'week': 7,
+    'month': 28,
+}
+
+MAX_BUCKETS = 1000
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(weeks=1)
+    if granularity == 'month':
+        if day.month == 12:
+            return day.replace(year=day.year + 1, month=1, day=1)
+        return day.replace(month=day.month + 1, day=1)
+    return day + timedelta(days=1)
+
+def iter_buckets(start, end, granularity):
+    day = bucket_start(start, granularity)
+    while day <= end:
+        yield day
+        day = next_bucket(day, granularity)
+
+def revenue_series(start, end, granularity='day'):
+    """
+    Revenue of DONE orders created between the dates start and end
+    (both inclusive), read from the DailySales rollup and grouped by day,
+    week or month. Returns (bucket start date, total) pairs in ascending
+    order, buckets without orders are filled with 0.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+    if start > end:
+        raise ValueError('start must not be after end')
+    if (end - start).days // BUCKET_DAYS[granularity] > MAX_BUCKETS:
+        raise ValueError('Date range is too large')
+    rows = DailySales.objects.filter(
+        date__gte=start,
+        date__lte=end,
+    ).annotate(
+        bucket=GRANULARITIES[granularity]('date')
+    ).values('bucket').annotate(total=Sum('revenue')).order_by('bucket')
+
+    totals = {row['bucket']: row['total'] or 0 for row in rows}
+    return [
+        (day, totals.get(day, 0))
+        for day in iter_buckets(start, end, granularity)
+    ]
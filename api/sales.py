@@ -0,0 +1,107 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+from .models import DailySales, Order, OrderDetail
+
+STATUS_FIELDS = {
+    'PENDING': 'pending_count',
+    'DONE': 'done_count',
+}
+
+ROLLUP_FIELDS = ('revenue', 'order_count', 'pending_count', 'done_count', 'units_sold')
+
+
+def _status_deltas(status, price, sign):
+    deltas = {STATUS_FIELDS[status]: sign}
+    if status == 'DONE':
+        deltas['revenue'] = sign * (price or 0)
+    return deltas
+
+def apply_deltas(day, deltas):
+    """
+    Add the deltas to the rollup row of the day, creating the row if needed.
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if len(deltas) == 0:
+        return
+    DailySales.objects.bulk_create([DailySales(date=day)], ignore_conflicts=True)
+    DailySales.objects.filter(date=day).update(
+        **{field: F(field) + value for field, value in deltas.items()}
+    )
+
+def record_order_created(order, units):
+    deltas = _status_deltas(order.order_status, order.price, 1)
+    deltas['order_count'] = 1
+    deltas['units_sold'] = units
+    apply_deltas(timezone.localdate(order._created), deltas)
+
+def record_order_changed(order, old_status, old_price):
+    if old_status == order.order_status and old_price == order.price:
+        return
+    deltas = defaultdict(int)
+    for field, value in _status_deltas(old_status, old_price, -1).items():
+        deltas[field] += value
+    for field, value in _status_deltas(order.order_status, order.price, 1).items():
+        deltas[field] += value
+    apply_deltas(timezone.localdate(order._created), deltas)
+
+def aggregate_orders(orders):
+    """
+    Rollup values of an Order queryset grouped by the local date the
+    orders were created on.
+    """
+    tz = timezone.get_current_timezone()
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    rows = orders.annotate(
+        day=TruncDay('_created', tzinfo=tz)
+    ).values('day').annotate(
+        order_count=Count('id'),
+        pending_count=Count('id', filter=Q(order_status='PENDING')),
+        done_count=Count('id', filter=Q(order_status='DONE')),
+        revenue=Sum('price', filter=Q(order_status='DONE')),
+    ).order_by()
+    for row in rows:
+        day = timezone.localtime(row['day'], tz).date()
+        totals[day]['order_count'] = row['order_count']
+        totals[day]['pending_count'] = row['pending_count']
+        totals[day]['done_count'] = row['done_count']
+        totals[day]['revenue'] = row['revenue'] or 0
+    units = OrderDetail.objects.filter(order__in=orders).annotate(
+        day=TruncDay('order___created', tzinfo=tz)
+    ).values('day').annotate(units_sold=Sum('quantity')).order_by()
+    for row in units:
+        day = timezone.localtime(row['day'], tz).date()
+        totals[day]['units_sold'] = row['units_sold'] or 0
+    return totals
+
+def record_orders_deleted(orders):
+    for day, values in aggregate_orders(orders).items():
+        apply_deltas(day, {field: -value for field, value in values.items()})
+
+def rebuild_daily_sales(start=None, end=None):
+    """
+    Recompute the rollup rows between the dates start and end (inclusive,
+    open ended when None) from the Order table. Returns the number of days
+    with orders.
+    """
+    tz = timezone.get_current_timezone()
+    orders = Order.objects.all()
+    rollups = DailySales.objects.all()
+    if start is not None:
+        orders = orders.filter(_created__gte=timezone.make_aware(datetime.combine(start, time.min), tz))
+        rollups = rollups.filter(date__gte=start)
+    if end is not None:
+        orders = orders.filter(_created__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz))
+        rollups = rollups.filter(date__lte=end)
+
+    with transaction.atomic():
+        totals = aggregate_orders(orders)
+        rollups.delete()
+        DailySales.objects.bulk_create(
+            [DailySales(date=day, **values) for day, values in totals.items()],
+            batch_size=1000
+        )
+    return len(totals)
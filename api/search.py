@@ -0,0 +1,240 @@
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Max
+from .invalidation import invalidation_bus
+from .models import Product, SearchIndexChange
+
+SEARCH = 'search'
+# Changes kept for the other processes to replay, one further behind rebuilds its index
+CHANGE_LOG_SIZE = getattr(settings, 'SEARCH_CHANGE_LOG_SIZE', 10000)
+
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+# A query token that is only a prefix of an indexed token scores this share of an exact match
+PREFIX_WEIGHT = 0.5
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    """
+    Lowercase text and strip Vietnamese diacritics: "Gà Quay" -> "ga quay".
+    """
+    text = (text or '').replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index of live products over their name, category
+    name and description. Built from the database on first use and kept
+    up to date by the admin product and category views, which also log
+    the change in SearchIndexChange and publish SEARCH so the other
+    processes replay it on their index.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        # Id of the newest SearchIndexChange the index reflects
+        self._last_change = 0
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._tokens = []
+
+    def _document(self, name, category, description):
+        weights = defaultdict(float)
+        for field, text in (('name', name), ('category', category), ('description', description)):
+            for token in set(tokenize(text)):
+                weights[token] += FIELD_WEIGHTS[field]
+        return weights
+
+    def _add(self, product_id, weights, keep_sorted=True):
+        self._documents[product_id] = weights
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if len(postings) == 0 and keep_sorted:
+                bisect.insort(self._tokens, token)
+            postings[product_id] = weight
+
+    def _remove(self, product_id):
+        weights = self._documents.pop(product_id, None)
+        if weights is None:
+            return
+        for token in weights:
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if len(postings) == 0:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def _products(self):
+        return Product.objects.values_list(
+            'id', 'name', 'category__name', 'description'
+        )
+
+    def build(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._documents = {}
+            self._tokens = []
+            # Read before the products, changes logged in between are replayed again
+            self._last_change = SearchIndexChange.objects.aggregate(last=Max('id'))['last'] or 0
+            for product_id, name, category, description in self._products().iterator():
+                self._add(product_id, self._document(name, category, description), keep_sorted=False)
+            self._tokens = sorted(self._postings)
+            self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+
+    def reset(self):
+        """
+        Drop the index, the next search rebuilds it from the database.
+        """
+        with self._lock:
+            self._built = False
+            self._last_change = 0
+            self._postings = defaultdict(dict)
+            self._documents = {}
+            self._tokens = []
+
+    def _update_product(self, product_id):
+        self._remove(product_id)
+        for product_id, name, category, description in self._products().filter(id=product_id):
+            self._add(product_id, self._document(name, category, description))
+
+    def _update_category(self, category_id):
+        for product_id, name, category, description in self._products().filter(category=category_id):
+            self._remove(product_id)
+            self._add(product_id, self._document(name, category, description))
+
+    def _publish(self, **change):
+        change = SearchIndexChange.objects.create(**change)
+        SearchIndexChange.objects.filter(id__lte=change.id - CHANGE_LOG_SIZE).delete()
+        invalidation_bus.publish(SEARCH)
+
+    def update_product(self, product_id):
+        """
+        Reindex a created or updated product, removes it once it is deleted.
+        """
+        self._publish(product_id=product_id)
+        with self._lock:
+            if self._built:
+                self._update_product(product_id)
+
+    def remove_product(self, product_id):
+        self._publish(product_id=product_id)
+        with self._lock:
+            if self._built:
+                self._remove(product_id)
+
+    def update_category(self, category_id):
+        self._publish(category_id=category_id)
+        with self._lock:
+            if self._built:
+                self._update_category(category_id)
+
+    def sync(self):
+        """
+        Replay the changes logged since the index was built or last synced.
+        Changes are reread from the database, so replaying one this process
+        already applied is harmless. Rebuilds on the next search when the
+        log no longer holds every change since.
+        """
+        with self._lock:
+            if not self._built:
+                return
+            changes = list(
+                SearchIndexChange.objects.filter(id__gte=self._last_change).order_by('id').values_list(
+                    'id', 'product_id', 'category_id'
+                )[:CHANGE_LOG_SIZE]
+            )
+            if len(changes) == CHANGE_LOG_SIZE or (
+                self._last_change > 0 and (len(changes) == 0 or changes[0][0] != self._last_change)
+            ):
+                self.reset()
+                return
+            for change_id, product_id, category_id in changes:
+                if product_id is not None:
+                    self._update_product(product_id)
+                if category_id is not None:
+                    self._update_category(category_id)
+            if len(changes) > 0:
+                self._last_change = changes[-1][0]
+
+    def _prefix_postings(self, query_token):
+        """
+        (postings, factor) of every indexed token starting with
+        query_token, exact matches score their full weight, prefix
+        matches PREFIX_WEIGHT of it.
+        """
+        matched = []
+        index = bisect.bisect_left(self._tokens, query_token)
+        while index < len(self._tokens) and self._tokens[index].startswith(query_token):
+            token = self._tokens[index]
+            index += 1
+            matched.append((self._postings[token], 1.0 if token == query_token else PREFIX_WEIGHT))
+        return matched
+
+    def _matches(self, matched, candidates=None):
+        """
+        Scores of the products in matched, only of candidates when given.
+        """
+        scores = {}
+        for postings, factor in matched:
+            if candidates is None:
+                items = postings.items()
+            elif len(candidates) < len(postings):
+                items = ((product_id, postings[product_id]) for product_id in candidates if product_id in postings)
+            else:
+                items = ((product_id, weight) for product_id, weight in postings.items() if product_id in candidates)
+            for product_id, weight in items:
+                score = weight * factor
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+
+    def search(self, query, limit=20):
+        """
+        Ids of the products matching every token of query (the tokens are
+        matched as prefixes), best matches first.
+        """
+        query_tokens = tokenize(query)
+        if len(query_tokens) == 0:
+            return []
+        self.ensure_built()
+        with self._lock:
+            # Rarest token first, the others only score its matches
+            matched_tokens = sorted(
+                (self._prefix_postings(query_token) for query_token in dict.fromkeys(query_tokens)),
+                key=lambda matched: sum(len(postings) for postings, factor in matched)
+            )
+            scores = None
+            for matched in matched_tokens:
+                matches = self._matches(matched, scores)
+                if scores is not None:
+                    matches = {product_id: scores[product_id] + score for product_id, score in matches.items()}
+                scores = matches
+                if len(scores) == 0:
+                    return []
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, score in ranked]
+
+product_index = ProductSearchIndex()
+invalidation_bus.subscribe(SEARCH, product_index.sync)
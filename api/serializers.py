@@ -1,7 +1,22 @@
 from rest_framework import serializers
-from .models import User, Product, Category, Order, OrderDetail, Cart, Review, FavoriteProduct, History, Coupon
+from .fieldsets import SparseFieldsetMixin
+from .images import derivative_urls
+from .models import User, Product, Category, Order, OrderDetail, Cart, Review, FavoriteProduct, History, Coupon, ProductRating
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Resized and WebP versions of a local image column, see api.images.
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return derivative_urls(value)
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = (
@@ -30,16 +45,40 @@ class UserSerializer(serializers.ModelSerializer):
         instance.address = validated_data.get('address', instance.address)
         instance.date_of_birth = validated_data.get('date_of_birth', instance.date_of_birth)
         instance.image = validated_data.get('image', instance.image)
-        instance.save()
+        # Only these columns: balance is debited and topped up with F() meanwhile
+        instance.save(update_fields=['name', 'email', 'phone', 'address', 'date_of_birth', 'image'])
         return instance
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductRatingSerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ProductRating
+        exclude = ('product',)
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
+    rating = ProductRatingSerializer(source='rating_summary', read_only=True)
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Product
         fields = "__all__"
 
-class CategorySerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        """
+        Write only the columns of the request. Checkout reserves stock with
+        an F() update of quantity, saving the whole row would put back the
+        quantity read when the request started.
+        """
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=[*validated_data, '_updated'])
+        return instance
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Category
         fields = '__all__'
@@ -62,13 +101,18 @@ class AdminOrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class OrderDetailSerializer(serializers.ModelSerializer):
-    name = serializers.CharField(source='product.name', read_only=True)
-    image = serializers.CharField(source='product.image', read_only=True)
-    price = serializers.FloatField(source='product.price', read_only=True)
-
     class Meta:
         model = OrderDetail
         fields = '__all__'
+        # Snapshot of the product when the order was placed
+        read_only_fields = ('name', 'image', 'price')
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    details = OrderDetailSerializer(source='detail_order_fk', many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = '__all__'
 
 class CartSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='product.name', read_only=True)
@@ -102,8 +146,9 @@ class FavoriteProductSerializer(serializers.ModelSerializer):
         model = FavoriteProduct
         fields = '__all__'
 
-class AdminUserSerializer(serializers.ModelSerializer):
+class AdminUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     role = serializers.SerializerMethodField()
+    sparse_sources = {'role': ('is_staff', 'is_superuser')}
 
     class Meta:
         model = User
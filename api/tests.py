@@ -1,3 +1,1701 @@
-from django.test import TestCase
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .audit import AuditLogWriter, audit_writer
+from .cache import coupon_cache, product_cache
+from .exports import EXPORT_CHUNK_SIZE, ORDER_FIELDS, ORDER_LINE_FIELDS, USER_FIELDS
+from .helper import ExpiringLRUCache, decode_token, get_user_role, role_cache, token_cache
+from .images import DERIVATIVE_SIZES, derivative_urls
+from .invalidation import invalidation_bus
+from .models import User, Category, Coupon, Product, Order, OrderDetail, History, DailySales, FavoriteProduct, ProductRating
+from .pagination import KeysetPagination
+from .placeholders import image_placeholder
+from .ratings import rebuild_product_ratings
+from .search import ProductSearchIndex, product_index
+from .serializers import OrderDetailSerializer, ProductSerializer, UserSerializer
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from PIL import Image
+from unittest import mock
+import asyncio
+import csv
+import json
+import jwt
+import multiprocessing
+import shutil
+import tempfile
+import time
 
 # Create your tests here.
+
+def create_user(username, **kwargs):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='password',
+        phone='0123456789',
+        **kwargs
+    )
+
+def create_token(user):
+    return jwt.encode({'id': user.id}, 'secret', algorithm='HS256')
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class OrderAPIViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        product_cache.clear()
+        invalidation_bus.poll(force=True)
+        self.user = create_user('customer', balance=1000000)
+        self.token = create_token(self.user)
+        category = Category.objects.create(_creator=self.user, _updater=self.user, name='Burger')
+        self.products = [
+            Product.objects.create(
+                _creator=self.user,
+                _updater=self.user,
+                name=f'Burger {i}',
+                price=10000,
+                quantity=100,
+                category=category,
+            )
+            for i in range(10)
+        ]
+
+    def place_order(self, products):
+        return self.client.post(
+            '/api/order',
+            {
+                'token': self.token,
+                'address': '1 Le Loi',
+                'products': [
+                    {'product': product.id, 'quantity': 2}
+                    for product in products
+                ],
+            },
+            content_type='application/json'
+        )
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        with self.assertNumQueries(12):
+            response = self.place_order(self.products[:1])
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(12):
+            response = self.place_order(self.products)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OrderDetail.objects.count(), 11)
+        self.assertEqual(History.objects.filter(_creator=self.user).count(), 2)
+        order = Order.objects.latest('id')
+        self.assertEqual(order.price, 10 * 2 * 10000)
+
+    def test_repeat_checkout_reads_products_from_cache(self):
+        response = self.place_order(self.products)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(11):
+            response = self.place_order(self.products)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).quantity, 96)
+
+    def post_products(self, products):
+        return self.client.post(
+            '/api/order',
+            {'token': self.token, 'address': '1 Le Loi', 'products': products},
+            content_type='application/json'
+        )
+
+    def test_rejects_products_that_are_not_a_list_of_objects(self):
+        for products in (5, 'abc', {'product': self.products[0].id, 'quantity': 1}, [5], []):
+            response = self.post_products(products)
+            self.assertEqual(response.status_code, 400, products)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_rejects_quantities_that_are_not_positive_integers(self):
+        for quantity in (2.5, '3', 0, -1, True, None):
+            response = self.post_products([{'product': self.products[0].id, 'quantity': quantity}])
+            self.assertEqual(response.status_code, 400, quantity)
+            self.assertEqual(response.json(), {'detail': 'Quantity must be a positive integer'})
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).quantity, 100)
+
+    def test_unknown_product_rolls_back(self):
+        response = self.client.post(
+            '/api/order',
+            {
+                'token': self.token,
+                'address': '1 Le Loi',
+                'products': [{'product': 0, 'quantity': 1}],
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(OrderDetail.objects.count(), 0)
+        self.assertEqual(History.objects.count(), 0)
+
+    def test_out_of_stock_rolls_back(self):
+        self.products[0].quantity = 1
+        self.products[0].save()
+        response = self.place_order(self.products[:2])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Product.objects.get(id=self.products[1].id).quantity, 100)
+        self.assertEqual(User.objects.get(id=self.user.id).balance, 1000000)
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class CheckoutCouponCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        coupon_cache.clear()
+        invalidation_bus.poll(force=True)
+        self.admin = create_user('admin', is_staff=True)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger',
+            price=10000,
+            quantity=100,
+            category=category,
+        )
+        self.coupon = Coupon.objects.create(
+            code='SALE',
+            name='Sale',
+            discount=10,
+            expiry_date=timezone.now() + timedelta(days=1),
+        )
+
+    def checkout(self, username):
+        user = create_user(username, balance=1000000)
+        return self.client.post(
+            '/api/order',
+            {
+                'token': create_token(user),
+                'address': '1 Le Loi',
+                'coupon': 'SALE',
+                'products': [{'product': self.product.id, 'quantity': 1}],
+            },
+            content_type='application/json'
+        )
+
+    def edit_coupon(self, **fields):
+        response = self.client.put(
+            f'/api/admin/coupon/{self.coupon.id}',
+            {'token': create_token(self.admin), **fields},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_edited_coupon_is_not_served_stale(self):
+        self.assertEqual(self.checkout('first').status_code, 200)
+        self.assertEqual(Order.objects.latest('id').price, 9000)
+        # Without a version bump the cached coupon is still served
+        Coupon.objects.filter(id=self.coupon.id).update(discount=50)
+        self.assertEqual(self.checkout('second').status_code, 200)
+        self.assertEqual(Order.objects.latest('id').price, 9000)
+
+        self.edit_coupon(discount=20)
+        self.assertEqual(self.checkout('third').status_code, 200)
+        self.assertEqual(Order.objects.latest('id').price, 8000)
+
+    def test_expired_coupon_is_not_served_stale(self):
+        self.assertEqual(self.checkout('first').status_code, 200)
+        self.edit_coupon(expiry_date=(timezone.now() - timedelta(minutes=1)).isoformat())
+
+        response = self.checkout('second')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Coupon expired'})
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    CHECKOUTS = 300
+    STOCK = 120
+    PRICE = 10000
+    BALANCE = 100 * PRICE
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('in-memory SQLite does not wait for locks between threads')
+        cache.clear()
+        product_cache.clear()
+        self.user = create_user('customer', balance=self.BALANCE)
+        self.token = create_token(self.user)
+        category = Category.objects.create(_creator=self.user, _updater=self.user, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.user,
+            _updater=self.user,
+            name='Burger',
+            price=self.PRICE,
+            quantity=self.STOCK,
+            category=category,
+        )
+
+    def checkout(self, index):
+        try:
+            response = Client().post(
+                '/api/order',
+                {
+                    'token': self.token,
+                    'address': '1 Le Loi',
+                    'products': [{'product': self.product.id, 'quantity': 1}],
+                },
+                content_type='application/json'
+            )
+            return response.status_code
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_keep_balance_and_stock_consistent(self):
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(self.checkout, range(self.CHECKOUTS)))
+
+        succeeded = results.count(200)
+        self.assertEqual(succeeded + results.count(400), self.CHECKOUTS)
+        # Balance runs out before stock does
+        self.assertEqual(succeeded, self.BALANCE // self.PRICE)
+
+        user = User.objects.get(id=self.user.id)
+        product = Product.objects.get(id=self.product.id)
+        self.assertEqual(user.balance, self.BALANCE - succeeded * self.PRICE)
+        self.assertGreaterEqual(user.balance, 0)
+        self.assertEqual(product.quantity, self.STOCK - succeeded)
+        self.assertEqual(Order.objects.count(), succeeded)
+        self.assertEqual(OrderDetail.objects.count(), succeeded)
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class WritesKeepConcurrentDebitsTests(TestCase):
+    """
+    Each write below loads its row, then a concurrent checkout commits
+    before the write saves it.
+    """
+    def setUp(self):
+        cache.clear()
+        invalidation_bus.poll(force=True)
+        self.admin = create_user('admin', is_staff=True)
+        self.user = create_user('customer', balance=1000)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger',
+            price=10000,
+            quantity=10,
+            category=category,
+        )
+
+    def checkout_meanwhile(self, original):
+        def wrapper(*args, **kwargs):
+            User.objects.filter(id=self.user.id).update(balance=F('balance') - 100)
+            Product.objects.filter(id=self.product.id).update(quantity=F('quantity') - 3)
+            return original(*args, **kwargs)
+        return wrapper
+
+    def patch(self, url, data):
+        return self.client.patch(url, data, content_type='application/json')
+
+    def assertDebitKept(self):
+        self.assertEqual(User.objects.get(id=self.user.id).balance, 900)
+
+    def test_profile_update(self):
+        with mock.patch.object(UserSerializer, 'is_valid', autospec=True, side_effect=self.checkout_meanwhile(UserSerializer.is_valid)):
+            response = self.patch('/api/user/update', {'token': create_token(self.user), 'name': 'Lan'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(id=self.user.id).name, 'Lan')
+        self.assertDebitKept()
+
+    def test_password_change(self):
+        with mock.patch.object(User, 'check_password', autospec=True, side_effect=self.checkout_meanwhile(User.check_password)):
+            response = self.patch(
+                '/api/user/update/password',
+                {'token': create_token(self.user), 'current_password': 'password', 'new_password': 'secret'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(id=self.user.id).check_password('secret'))
+        self.assertDebitKept()
+
+    def test_admin_user_update_and_delete(self):
+        with mock.patch.object(User, 'set_password', autospec=True, side_effect=self.checkout_meanwhile(User.set_password)):
+            response = self.patch(
+                f'/api/admin/users/{self.user.id}',
+                {'token': create_token(self.admin), 'password': 'secret', 'role': 'staff'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertDebitKept()
+        self.assertTrue(User.objects.get(id=self.user.id).is_staff)
+
+        with mock.patch.object(User.objects, 'get', side_effect=self.checkout_meanwhile(User.objects.get)):
+            response = self.client.delete(
+                f'/api/admin/users/{self.user.id}',
+                {'token': create_token(self.admin)},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(id=self.user.id)
+        self.assertEqual((user.is_active, user.balance), (False, 800))
+
+    def test_admin_product_update_and_delete_keep_reserved_stock(self):
+        token = create_token(self.admin)
+        with mock.patch.object(ProductSerializer, 'is_valid', autospec=True, side_effect=self.checkout_meanwhile(ProductSerializer.is_valid)):
+            response = self.client.put(
+                f'/api/admin/product/{self.product.id}',
+                {'token': token, 'price': 12000},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 202)
+            product = Product.objects.get(id=self.product.id)
+            self.assertEqual((product.price, product.quantity), (12000, 7))
+
+            response = self.client.delete(
+                f'/api/admin/product/{self.product.id}',
+                {'token': token},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 202)
+        product = Product.all_objects.get(id=self.product.id)
+        self.assertIsNotNone(product._deleted)
+        self.assertEqual(product.quantity, 4)
+
+@override_settings(AUDIT_LOG_BUFFERED=True, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class AuditLogWriterTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        product_cache.clear()
+        self.user = create_user('customer', balance=1000000)
+
+    def tearDown(self):
+        audit_writer.flush()
+
+    def test_full_batch_is_written_at_once(self):
+        writer = AuditLogWriter(max_batch=3, max_delay=60)
+        for index in range(2):
+            writer.log(self.user.id, f'entry {index}')
+        self.assertEqual(History.objects.count(), 0)
+        self.assertEqual(writer.stats()['pending'], 2)
+
+        writer.log(self.user.id, 'entry 2')
+        self.assertEqual(History.objects.count(), 3)
+        self.assertEqual(writer.stats(), {'pending': 0, 'logged': 3, 'written': 3, 'batches': 1, 'failed': 0})
+
+    def test_partial_batch_is_written_after_max_delay(self):
+        writer = AuditLogWriter(max_batch=100, max_delay=0.05)
+        writer.log(self.user.id, 'entry')
+        deadline = time.monotonic() + 5
+        while writer.stats()['written'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(writer.stats()['written'], 1)
+        self.assertEqual(list(History.objects.values_list('message', flat=True)), ['entry'])
+
+    def test_rejected_batch_is_retried_row_by_row(self):
+        writer = AuditLogWriter(max_batch=3, max_delay=60)
+        writer.log(self.user.id, 'first')
+        writer.log(self.user.id + 1000, 'unknown user')
+        writer.log(self.user.id, 'last')
+        self.assertEqual(
+            sorted(History.objects.values_list('message', flat=True)),
+            ['first', 'last']
+        )
+        stats = writer.stats()
+        self.assertEqual((stats['written'], stats['failed'], stats['pending']), (2, 1, 0))
+
+    def test_transactional_request_flushes_at_request_end(self):
+        category = Category.objects.create(_creator=self.user, _updater=self.user, name='Burger')
+        product = Product.objects.create(
+            _creator=self.user,
+            _updater=self.user,
+            name='Burger',
+            price=10000,
+            quantity=100,
+            category=category,
+        )
+        response = self.client.post(
+            '/api/order',
+            {
+                'token': create_token(self.user),
+                'address': '1 Le Loi',
+                'products': [{'product': product.id, 'quantity': 1}],
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        # Written before the timer (AUDIT_LOG_MAX_DELAY) would have fired
+        self.assertEqual(audit_writer.stats()['pending'], 0)
+        self.assertEqual(History.objects.filter(_creator=self.user).count(), 1)
+
+@override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+class AdminGetOrdersAPIViewTests(TestCase):
+    def setUp(self):
+        invalidation_bus.poll(force=True)
+        self.users = [create_user(f'customer{i}', name=f'Customer {i}') for i in range(3)]
+        for i in range(30):
+            user = self.users[i % 3]
+            Order.objects.create(
+                _creator=user,
+                _updater=user,
+                user=user,
+                price=1000 * i,
+                order_status='DONE' if i % 2 else 'PENDING',
+            )
+
+    def test_pages_run_one_query_each(self):
+        ids = []
+        url = '/api/admin/orders?page_size=7'
+        while url is not None:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [order['id'] for order in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(len(ids), 30)
+        self.assertEqual(len(set(ids)), 30)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_filters(self):
+        user = self.users[0]
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/admin/orders?page_size=50&status=DONE&user={user.id}&ordering=_created')
+        results = response.json()['results']
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(order['order_status'] == 'DONE' for order in results))
+        self.assertTrue(all(order['name'] == user.name for order in results))
+        self.assertEqual([order['id'] for order in results], sorted(order['id'] for order in results))
+
+    def test_unpaginated_listing_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/admin/orders')
+        self.assertEqual(len(response.json()), 30)
+
+def read_product_price_twice(pipe, product_id):
+    """
+    Runs in a forked worker: report the price the API serves, wait for the
+    parent to update the product, then report it again.
+    """
+    connections.close_all()
+    client = Client()
+    pipe.send(client.get(f'/api/product/{product_id}').json()['price'])
+    pipe.recv()
+    pipe.send(client.get(f'/api/product/{product_id}').json()['price'])
+    connections.close_all()
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=0)
+class CacheInvalidationAcrossProcessesTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('worker processes cannot share an in-memory SQLite database')
+        cache.clear()
+        invalidation_bus.reset()
+        self.admin = create_user('admin', is_staff=True)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger',
+            price=10000,
+            quantity=10,
+            category=category,
+        )
+
+    def test_admin_update_reaches_other_worker(self):
+        context = multiprocessing.get_context('fork')
+        pipe, worker_pipe = context.Pipe()
+        connections.close_all()
+        worker = context.Process(target=read_product_price_twice, args=(worker_pipe, self.product.id))
+        worker.start()
+        try:
+            self.assertEqual(pipe.recv(), 10000)
+            response = self.client.put(
+                f'/api/admin/product/{self.product.id}',
+                {'token': create_token(self.admin), 'price': 12000},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 202)
+            pipe.send('updated')
+            # The worker's cached response is keyed by the catalog version it polled
+            self.assertEqual(pipe.recv(), 12000)
+        finally:
+            worker.join(10)
+        self.assertEqual(worker.exitcode, 0)
+
+
+class ImageUploadAPIViewTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = create_user('uploader')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {create_token(self.user)}')
+        image = BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(image, 'PNG')
+        self.png = image.getvalue()
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.client.post('/api/upload/image', self.png, content_type='image/png')
+        second = self.client.post('/api/upload/image', self.png, content_type='image/png')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json()['image'], second.json()['image'])
+        digest = first.json()['digest']
+        response = self.client.get(first.json()['image'])
+        self.assertEqual(response['ETag'], f'"{digest}"')
+
+    def test_rejects_files_that_are_not_images(self):
+        response = self.client.post('/api/upload/image', b'not an image', content_type='image/png')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_decompression_bombs(self):
+        # Pillow refuses images over twice MAX_IMAGE_PIXELS
+        with mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 16):
+            response = self.client.post('/api/upload/image', self.png, content_type='image/png')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Image has too many pixels'})
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        Path(self.media_root, 'product_image').mkdir()
+        self.source = Path(self.media_root, 'product_image', 'Pepsi.png')
+        Image.new('RGBA', (800, 400), (0, 80, 200, 255)).save(self.source)
+
+    def test_urls_name_every_size_in_webp_and_the_source_format(self):
+        variants = derivative_urls('/media/product_image/Pepsi.png')
+
+        self.assertEqual(set(variants), set(DERIVATIVE_SIZES))
+        for size, width in DERIVATIVE_SIZES.items():
+            self.assertEqual(variants[size]['width'], width)
+            self.assertRegex(variants[size]['webp'], rf'^/media/derivatives/product_image/Pepsi\.png\.[0-9a-f]{{16}}-{size}\.webp$')
+            self.assertEqual(variants[size]['png'], variants[size]['webp'][:-len('webp')] + 'png')
+        self.assertIsNone(derivative_urls('http://example.com/Pepsi.png'))
+        self.assertIsNone(derivative_urls('product_image/Missing.png'))
+
+    def test_urls_change_with_the_content(self):
+        before = derivative_urls('product_image/Pepsi.png')
+        Image.new('RGB', (800, 400), 'red').save(self.source)
+
+        self.assertNotEqual(derivative_urls('product_image/Pepsi.png')['thumb']['webp'], before['thumb']['webp'])
+
+    def test_first_request_builds_the_derivative(self):
+        url = derivative_urls('product_image/Pepsi.png')['thumb']['webp']
+        path = Path(self.media_root, url[len('/media/'):])
+        self.assertFalse(path.exists())
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (DERIVATIVE_SIZES['thumb'], DERIVATIVE_SIZES['thumb'] // 2)))
+        built = path.stat().st_mtime_ns
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(path.stat().st_mtime_ns, built)
+
+    def test_stale_or_malformed_names_are_not_built(self):
+        url = derivative_urls('product_image/Pepsi.png')['thumb']['webp']
+        Image.new('RGB', (800, 400), 'red').save(self.source)
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url.replace('-thumb.', '-huge.')).status_code, 404)
+        self.assertFalse(Path(self.media_root, 'derivatives').exists())
+
+    def test_only_safe_methods_are_allowed(self):
+        url = derivative_urls('product_image/Pepsi.png')['thumb']['webp']
+
+        path = Path(self.media_root, url[len('/media/'):])
+
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.assertFalse(path.exists())
+        self.assertEqual(self.client.head(url).status_code, 200)
+        self.assertTrue(path.exists())
+
+    def test_decompression_bombs_are_not_built(self):
+        url = derivative_urls('product_image/Pepsi.png')['thumb']['webp']
+        # Pillow refuses images over twice MAX_IMAGE_PIXELS
+        with mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 16):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            stderr = StringIO()
+            call_command('build_image_derivatives', stdout=StringIO(), stderr=stderr)
+
+        self.assertIn('Skipped product_image/Pepsi.png', stderr.getvalue())
+        self.assertEqual([path for path in Path(self.media_root, 'derivatives').rglob('*') if path.is_file()], [])
+
+    def test_command_builds_every_derivative(self):
+        stdout = StringIO()
+        call_command('build_image_derivatives', stdout=stdout)
+
+        built = sorted(path.name for path in Path(self.media_root, 'derivatives', 'product_image').iterdir())
+        self.assertEqual(len(built), len(DERIVATIVE_SIZES) * 2)
+        self.assertEqual({name.rsplit('.', 1)[1] for name in built}, {'webp', 'png'})
+        self.assertIn(f'Built {len(built)} derivatives of 1 images', stdout.getvalue())
+
+@override_settings(CACHE_INVALIDATION_POLL_INTERVAL=0)
+class ServeMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = bytes(range(256)) * 4
+        Path(self.media_root, 'menu.bin').write_bytes(self.content)
+
+    def test_media_requests_do_not_poll_the_invalidation_bus(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/media/menu.bin')
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/category')
+        self.assertTrue(any('"api_cacheversion"' in query['sql'] for query in queries.captured_queries))
+
+    def test_serves_files_with_validators(self):
+        response = self.client.get('/media/menu.bin')
+
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertTrue(response['ETag'].startswith('"'))
+
+        response = self.client.get('/media/menu.bin', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.assertEqual(self.client.get('/media/missing.bin').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_head_sends_headers_only(self):
+        response = self.client.head('/media/menu.bin')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        self.assertEqual(self.client.post('/media/menu.bin').status_code, 405)
+
+    def test_serves_single_byte_ranges(self):
+        size = len(self.content)
+        for header, start, end in (
+            ('bytes=0-99', 0, 99),
+            ('bytes=1000-', 1000, size - 1),
+            ('bytes=-24', size - 24, size - 1),
+            ('bytes=1000-5000', 1000, size - 1),
+        ):
+            response = self.client.get('/media/menu.bin', HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+            self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+    def test_unsatisfiable_range_is_416(self):
+        response = self.client.get('/media/menu.bin', HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_range_of_a_changed_file_sends_it_whole(self):
+        response = self.client.get('/media/menu.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_accel_redirect_leaves_the_file_to_the_proxy(self):
+        with mock.patch('api.media.ACCEL_REDIRECT', 'x-accel-redirect'):
+            response = self.client.get('/media/menu.bin')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/menu.bin')
+        self.assertNotIn('Content-Type', response)
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+@override_settings(AUDIT_LOG_BUFFERED=False)
+class ImagePlaceholderTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin', is_staff=True)
+        self.category = Category.objects.create(name='Drinks', _creator=self.admin, _updater=self.admin)
+
+    def test_changing_the_image_refreshes_the_placeholder(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        Image.new('RGB', (40, 20), (200, 30, 30)).save(f'{media_root}/red.png')
+        product = Product.objects.create(
+            name='Cola',
+            image='http://example.com/cola.png',
+            category=self.category,
+            _creator=self.admin,
+            _updater=self.admin
+        )
+
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.put(
+                f'/api/admin/product/{product.id}',
+                {'token': create_token(self.admin), 'image': 'red.png'},
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 202)
+        product.refresh_from_db()
+        self.assertEqual((product.image_width, product.image_height), (40, 20))
+        self.assertEqual(product.image_color, '#c81e1e')
+        self.assertEqual(len(product.image_placeholder), 28)
+        self.assertEqual(response.json()['image_placeholder'], product.image_placeholder)
+
+    def test_decompression_bombs_get_no_placeholder(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        Image.new('RGB', (40, 20), (200, 30, 30)).save(f'{media_root}/red.png')
+
+        with override_settings(MEDIA_ROOT=media_root), mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 100):
+            self.assertIsNone(image_placeholder('red.png'))
+
+
+class AsyncCatalogViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('customer')
+        self.category = Category.objects.create(_creator=self.user, _updater=self.user, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.user,
+            _updater=self.user,
+            name='Burger',
+            price=10000,
+            category=self.category,
+        )
+
+    def test_async_views_answer_like_the_sync_ones(self):
+        for url in ('product', f'product/{self.product.id}', f'category/{self.category.id}'):
+            cache.clear()
+            sync_response = Client().get(f'/api/{url}')
+            cache.clear()
+            async_response = asyncio.run(AsyncClient().get(f'/api/async/{url}'))
+
+            self.assertEqual(async_response.status_code, sync_response.status_code)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_async_views_are_read_only(self):
+        response = asyncio.run(AsyncClient().post('/api/async/product'))
+
+        self.assertEqual(response.status_code, 405)
+
+
+class UserFavoriteProductTests(TestCase):
+    def setUp(self):
+        self.first = create_user('first')
+        self.second = create_user('second')
+        category = Category.objects.create(_creator=self.first, _updater=self.first, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.first,
+            _updater=self.first,
+            name='Burger',
+            category=category,
+        )
+
+    def favorite(self, user, method='post'):
+        return getattr(self.client, method)(
+            '/api/user/favorite',
+            {'token': create_token(user), 'product': self.product.id},
+            content_type='application/json'
+        )
+
+    def test_removing_a_favorite_keeps_other_users_favorites(self):
+        self.favorite(self.first)
+        self.favorite(self.second)
+
+        response = self.favorite(self.first, method='delete')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(FavoriteProduct.objects.filter(_creator=self.first).exists())
+        self.assertTrue(FavoriteProduct.objects.filter(_creator=self.second, product=self.product).exists())
+        self.assertEqual(self.favorite(self.first, method='delete').status_code, 400)
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin', is_staff=True, is_superuser=True)
+        self.category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.products = [
+            Product.objects.create(_creator=self.admin, _updater=self.admin, name=f'Burger {i}', category=self.category)
+            for i in range(3)
+        ]
+
+    def test_soft_delete_and_restore(self):
+        old_updated = self.products[0]._updated
+        deleted = Product.objects.filter(id__in=[self.products[0].id, self.products[1].id])
+
+        self.assertEqual(deleted.soft_delete(), 2)
+        self.assertEqual(Product.all_objects.filter(id=self.products[0].id).soft_delete(), 0)
+        self.assertEqual(list(Product.objects.values_list('id', flat=True)), [self.products[2].id])
+        self.assertEqual(
+            sorted(Product.all_objects.deleted().values_list('id', flat=True)),
+            [self.products[0].id, self.products[1].id]
+        )
+        self.assertEqual(Product.all_objects.live().count(), 1)
+        product = Product.all_objects.get(id=self.products[0].id)
+        self.assertIsNotNone(product._deleted)
+        self.assertGreater(product._updated, old_updated)
+
+        self.assertEqual(Product.all_objects.filter(id=self.products[0].id).restore(), 1)
+        self.assertEqual(Product.all_objects.restore(), 1)
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertFalse(Product.all_objects.deleted().exists())
+
+    def test_admin_lists_and_restores_deleted_rows(self):
+        Product.objects.filter(id=self.products[0].id).soft_delete()
+        self.client.force_login(self.admin)
+
+        response = self.client.get('/admin/api/product/')
+        self.assertContains(response, 'Burger 0')
+
+        response = self.client.post('/admin/api/product/', {
+            'action': 'restore_selected',
+            admin.helpers.ACTION_CHECKBOX_NAME: [self.products[0].id],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_admin_foreign_keys_accept_deleted_rows(self):
+        Product.objects.filter(id=self.products[0].id).soft_delete()
+        request = RequestFactory().get('/admin/api/orderdetail/add/')
+        request.user = self.admin
+
+        form = admin.site._registry[OrderDetail].get_form(request)()
+        self.assertIn(self.products[0], form.fields['product'].queryset)
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('admin')
+        self.category = Category.objects.create(_creator=self.user, _updater=self.user, name='Burger')
+        self.create_products(5)
+
+    def create_products(self, count):
+        Product.objects.bulk_create([
+            Product(_creator=self.user, _updater=self.user, name=f'Burger {index}', category=self.category)
+            for index in range(count)
+        ])
+        # Newest first, ties on _created broken by id
+        self.ids = list(Product.objects.order_by('-_created', '-id').values_list('id', flat=True))
+
+    def page_ids(self, page):
+        return [product['id'] for product in page['results']]
+
+    def test_cursor_walks_forward_and_back(self):
+        first = self.client.get('/api/product', {'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        last = self.client.get(second['next']).json()
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual(self.page_ids(first), self.ids[:2])
+        self.assertEqual(self.page_ids(second), self.ids[2:4])
+        self.assertEqual(self.page_ids(back), self.ids[:2])
+        self.assertEqual(self.page_ids(last), self.ids[4:])
+        self.assertIsNone(last['next'])
+
+    def test_page_size_is_capped(self):
+        self.create_products(KeysetPagination.max_page_size)
+
+        response = self.client.get('/api/product', {'page_size': 10 * KeysetPagination.max_page_size}).json()
+
+        self.assertEqual(len(response['results']), KeysetPagination.max_page_size)
+        self.assertIsNotNone(response['next'])
+
+    def test_listing_without_page_parameters_is_not_paginated(self):
+        response = self.client.get('/api/product').json()
+
+        self.assertIsInstance(response, list)
+        self.assertEqual(sorted(product['id'] for product in response), sorted(self.ids))
+
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class CatalogResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidation_bus.poll(force=True)
+        self.admin = create_user('admin', is_staff=True)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger',
+            price=10000,
+            category=category,
+        )
+
+    def test_second_request_is_served_from_the_cache(self):
+        first = self.client.get('/api/product').json()
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/product').json()
+        self.assertEqual(second, first)
+
+    def test_admin_write_invalidates_the_cached_response(self):
+        self.assertEqual(self.client.get('/api/product').json()[0]['price'], 10000)
+
+        response = self.client.put(
+            f'/api/admin/product/{self.product.id}',
+            {'token': create_token(self.admin), 'price': 12000},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+
+        self.assertEqual(self.client.get('/api/product').json()[0]['price'], 12000)
+
+class AuthenticationCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        role_cache.clear()
+
+    def test_cache_counts_hits_and_misses_and_expires_entries(self):
+        entries = ExpiringLRUCache(2)
+        entries.set('fresh', 1, time.time() + 60)
+        entries.set('expired', 2, time.time() - 1)
+
+        self.assertEqual(entries.get('fresh'), 1)
+        self.assertIsNone(entries.get('expired'))
+        self.assertIsNone(entries.get('missing'))
+        self.assertEqual(entries.stats(), {'size': 1, 'max_size': 2, 'hits': 1, 'misses': 2})
+
+    def test_verified_tokens_are_served_from_the_cache(self):
+        token = create_token(create_user('customer'))
+        hits = token_cache.hits
+
+        first = decode_token(token)
+        second = decode_token(token)
+
+        self.assertEqual(first, second)
+        self.assertEqual(token_cache.hits, hits + 1)
+
+    def test_role_change_through_the_admin_endpoint_applies_at_once(self):
+        admin = create_user('admin', is_superuser=True)
+        staff = create_user('staff', is_staff=True)
+        self.assertEqual(get_user_role(staff.id), (True, False))
+
+        response = self.client.patch(
+            f'/api/admin/users/{staff.id}',
+            {'token': create_token(admin), 'role': 'user'},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_user_role(staff.id), (False, False))
+
+
+@override_settings(AUDIT_LOG_BUFFERED=False)
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin', is_superuser=True)
+        self.customer = create_user('customer')
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.burger = Product.objects.create(_creator=self.admin, _updater=self.admin, name='Burger', category=category)
+        self.fries = Product.objects.create(_creator=self.admin, _updater=self.admin, name='Fries', category=category)
+
+    def create_order(self, *products):
+        order = Order.objects.create(_creator=self.customer, _updater=self.customer, user=self.customer)
+        OrderDetail.objects.bulk_create([
+            OrderDetail(_creator=self.customer, _updater=self.customer, order=order, product=product, quantity=1)
+            for product in products
+        ])
+        return order
+
+    def review(self, order, rating):
+        response = self.client.post(
+            '/api/review',
+            {'token': create_token(self.customer), 'order': order.id, 'rating': rating, 'content': 'Good'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def summary(self, product):
+        rating = ProductRating.objects.get(product=product)
+        return rating.count, rating.total, [getattr(rating, f'star_{star}') for star in range(1, 6)]
+
+    def test_approved_review_counts_once_per_product_of_the_order(self):
+        self.review(self.create_order(self.burger, self.burger, self.fries), 4)
+
+        self.assertEqual(self.summary(self.burger), (1, 4.0, [0, 0, 0, 1, 0]))
+        self.assertEqual(self.summary(self.fries), (1, 4.0, [0, 0, 0, 1, 0]))
+
+    def test_rebuild_matches_incremental_summaries(self):
+        first = self.review(self.create_order(self.burger, self.burger), 4)
+        self.review(self.create_order(self.burger, self.fries), 2)
+        response = self.client.patch(
+            f'/api/admin/reviews/{first}',
+            {'token': create_token(self.admin), 'rating': 5},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        incremental = [self.summary(self.burger), self.summary(self.fries)]
+
+        rebuild_product_ratings()
+
+        self.assertEqual([self.summary(self.burger), self.summary(self.fries)], incremental)
+        self.assertEqual(incremental[0], (2, 7.0, [0, 1, 0, 0, 1]))
+
+
+class AdminRevenueAPIViewTests(TestCase):
+    def setUp(self):
+        # 2024-01-01 is a Monday
+        DailySales.objects.bulk_create([
+            DailySales(date=date(2024, 1, 1), revenue=100),
+            DailySales(date=date(2024, 1, 3), revenue=200),
+            DailySales(date=date(2024, 1, 9), revenue=50),
+            DailySales(date=date(2024, 2, 5), revenue=10),
+        ])
+
+    def series(self, start, end, granularity):
+        response = self.client.get(
+            '/api/admin/revenue/range',
+            {'start': start, 'end': end, 'granularity': granularity}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(row['date'], row['total']) for row in response.json()]
+
+    def test_days_without_sales_are_zero(self):
+        self.assertEqual(self.series('2024-01-01', '2024-01-04', 'day'), [
+            ('2024-01-01', 100),
+            ('2024-01-02', 0),
+            ('2024-01-03', 200),
+            ('2024-01-04', 0),
+        ])
+
+    def test_weeks_and_months_sum_their_days(self):
+        self.assertEqual(self.series('2024-01-01', '2024-01-21', 'week'), [
+            ('2024-01-01', 300),
+            ('2024-01-08', 50),
+            ('2024-01-15', 0),
+        ])
+        self.assertEqual(self.series('2024-01-01', '2024-03-31', 'month'), [
+            ('2024-01-01', 350),
+            ('2024-02-01', 10),
+            ('2024-03-01', 0),
+        ])
+
+    def test_rejects_bad_dates_and_granularity(self):
+        for params in (
+            {'start': '2024-13-01'},
+            {'start': '2024-02-01', 'end': '2024-01-01'},
+            {'granularity': 'year'},
+        ):
+            response = self.client.get('/api/admin/revenue/range', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('detail', response.json())
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Migrate the api app back to migrate_from, let before_migration()
+    create rows with the models of that state, then migrate to
+    migrate_to. self.apps holds the models after the migration.
+    """
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', self.migrate_from)])
+        self.before_migration(executor.loader.project_state([('api', self.migrate_from)]).apps)
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', self.migrate_to)])
+        self.apps = executor.loader.project_state([('api', self.migrate_to)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def before_migration(self, apps):
+        pass
+
+class DailySalesBackfillMigrationTests(MigrationTestCase):
+    migrate_from = '0027_image_placeholders'
+    migrate_to = '0028_backfill_daily_sales'
+
+    def before_migration(self, apps):
+        User = apps.get_model('api', 'User')
+        Category = apps.get_model('api', 'Category')
+        Product = apps.get_model('api', 'Product')
+        Order = apps.get_model('api', 'Order')
+        OrderDetail = apps.get_model('api', 'OrderDetail')
+        user = User.objects.create(username='customer', email='customer@example.com', password='password')
+        category = Category.objects.create(name='Burger', _creator=user, _updater=user)
+        product = Product.objects.create(name='Burger', category=category, _creator=user, _updater=user)
+        self.today = timezone.localdate()
+        self.earlier = self.today - timedelta(days=3)
+        for days_ago, order_status, price, quantity in ((3, 'DONE', 30000, 3), (3, 'PENDING', 10000, 1), (0, 'DONE', 20000, 2)):
+            order = Order.objects.create(user=user, order_status=order_status, price=price, _creator=user, _updater=user)
+            Order.objects.filter(id=order.id).update(_created=order._created - timedelta(days=days_ago))
+            OrderDetail.objects.create(order=order, product=product, quantity=quantity, _creator=user, _updater=user)
+
+    def test_backfills_a_row_per_day_with_orders(self):
+        DailySales = self.apps.get_model('api', 'DailySales')
+        rows = {
+            row.pop('date'): row
+            for row in DailySales.objects.values('date', 'order_count', 'pending_count', 'done_count', 'units_sold', 'revenue')
+        }
+
+        self.assertEqual(rows, {
+            self.earlier: {'order_count': 2, 'pending_count': 1, 'done_count': 1, 'units_sold': 4, 'revenue': 30000},
+            self.today: {'order_count': 1, 'pending_count': 0, 'done_count': 1, 'units_sold': 2, 'revenue': 20000},
+        })
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class OrderLineSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        product_cache.clear()
+        invalidation_bus.poll(force=True)
+        self.admin = create_user('admin', is_staff=True)
+        self.customer = create_user('customer', balance=1000000)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger Gà',
+            image='product_image/burger.png',
+            price=10000,
+            quantity=10,
+            category=category,
+        )
+        response = self.client.post(
+            '/api/order',
+            {
+                'token': create_token(self.customer),
+                'address': '1 Le Loi',
+                'products': [{'product': self.product.id, 'quantity': 2}],
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.order = Order.objects.latest('id')
+
+    def lines(self):
+        response = self.client.get(f'/api/user/{self.customer.id}/order/{self.order.id}')
+        return [(line['name'], line['image'], line['price']) for line in response.json()]
+
+    def test_lines_keep_the_product_as_ordered(self):
+        token = create_token(self.admin)
+        response = self.client.put(
+            f'/api/admin/product/{self.product.id}',
+            {'token': token, 'name': 'Burger Bò', 'image': 'product_image/beef.png', 'price': 15000},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.lines(), [('Burger Gà', 'product_image/burger.png', 10000)])
+
+        response = self.client.delete(
+            f'/api/admin/product/{self.product.id}',
+            {'token': token},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.lines(), [('Burger Gà', 'product_image/burger.png', 10000)])
+
+    def test_snapshot_fields_are_read_only(self):
+        line = OrderDetail.objects.get(order=self.order)
+        serializer = OrderDetailSerializer(line, data={'name': 'Free', 'price': 0, 'quantity': 3}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        line.refresh_from_db()
+        self.assertEqual((line.name, line.price, line.quantity), ('Burger Gà', 10000, 3))
+
+class OrderLineSnapshotMigrationTests(MigrationTestCase):
+    migrate_from = '0023_order_listing_indexes'
+    migrate_to = '0024_orderdetail_product_snapshot'
+
+    def before_migration(self, apps):
+        User = apps.get_model('api', 'User')
+        Category = apps.get_model('api', 'Category')
+        Product = apps.get_model('api', 'Product')
+        Order = apps.get_model('api', 'Order')
+        OrderDetail = apps.get_model('api', 'OrderDetail')
+        user = User.objects.create(username='customer', email='customer@example.com', password='password')
+        category = Category.objects.create(name='Burger', _creator=user, _updater=user)
+        order = Order.objects.create(user=user, _creator=user, _updater=user)
+        self.lines = {}
+        for name, image, price in (('Burger Gà', 'product_image/burger.png', 10000), ('Trà Đào', None, 25000)):
+            product = Product.objects.create(name=name, image=image, price=price, category=category, _creator=user, _updater=user)
+            line = OrderDetail.objects.create(order=order, product=product, quantity=1, _creator=user, _updater=user)
+            self.lines[line.id] = (name, image, price)
+
+    def test_copies_the_current_product_into_existing_lines(self):
+        OrderDetail = self.apps.get_model('api', 'OrderDetail')
+
+        self.assertEqual(
+            {line.id: (line.name, line.image, line.price) for line in OrderDetail.objects.all()},
+            self.lines
+        )
+
+@override_settings(AUDIT_LOG_BUFFERED=False)
+class DailySalesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        product_cache.clear()
+        self.admin = create_user('admin', is_superuser=True)
+        self.customer = create_user('customer', balance=1000000)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger',
+            price=10000,
+            quantity=100,
+            category=category,
+        )
+
+    def place_order(self):
+        response = self.client.post(
+            '/api/order',
+            {
+                'token': create_token(self.customer),
+                'address': '1 Le Loi',
+                'products': [{'product': self.product.id, 'quantity': 3}],
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return Order.objects.latest('id')
+
+    def rollup(self, day):
+        return DailySales.objects.values(
+            'order_count', 'pending_count', 'done_count', 'units_sold', 'revenue'
+        ).get(date=day)
+
+    def test_checkout_counts_the_order_on_its_day(self):
+        order = self.place_order()
+
+        self.assertEqual(self.rollup(timezone.localdate(order._created)), {
+            'order_count': 1, 'pending_count': 1, 'done_count': 0, 'units_sold': 3, 'revenue': 0.0,
+        })
+
+    def test_status_change_moves_the_order_on_the_day_it_was_created(self):
+        order = self.place_order()
+        created = timezone.localdate(order._created)
+        earlier = created - timedelta(days=3)
+        # Move the order and its rollup to three days ago
+        Order.objects.filter(id=order.id).update(_created=order._created - timedelta(days=3))
+        DailySales.objects.filter(date=created).update(date=earlier)
+
+        response = self.client.patch(
+            f'/api/admin/orders/detail/{order.id}',
+            {'token': create_token(self.admin), 'order_status': 'DONE'},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rollup(earlier), {
+            'order_count': 1, 'pending_count': 0, 'done_count': 1, 'units_sold': 3, 'revenue': order.price,
+        })
+        self.assertFalse(DailySales.objects.filter(date=created).exists())
+
+
+@override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+class AdminOverviewStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidation_bus.poll(force=True)
+        create_user('admin', is_superuser=True)
+        create_user('staff', is_staff=True)
+        create_user('customer')
+        DailySales.objects.bulk_create([
+            DailySales(date=date(2024, 1, 1), order_count=3, pending_count=1, done_count=2, revenue=500),
+            DailySales(date=date(2024, 1, 2), order_count=1, pending_count=1, done_count=0, revenue=0),
+        ])
+
+    def test_stats_take_two_queries_then_come_from_the_cache(self):
+        with self.assertNumQueries(2):
+            first = self.client.get('/api/admin/stats').json()
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/admin/stats').json()
+
+        self.assertEqual(first, {
+            'total_user': 3,
+            'admin': 1,
+            'staff': 1,
+            'user': 1,
+            'total_order': 4,
+            'order_is_doned': 2,
+            'order_in_progress': 2,
+            'doned_order_total': 500.0,
+        })
+        self.assertEqual(second, first)
+
+
+@override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+class UserOrderHistoryAPIViewTests(TestCase):
+    def setUp(self):
+        invalidation_bus.poll(force=True)
+        self.user = create_user('customer')
+        category = Category.objects.create(_creator=self.user, _updater=self.user, name='Burger')
+        product = Product.objects.create(_creator=self.user, _updater=self.user, name='Burger', category=category)
+        for order_status in ('DONE', 'PENDING', 'DONE'):
+            order = Order.objects.create(_creator=self.user, _updater=self.user, user=self.user, order_status=order_status)
+            OrderDetail.objects.bulk_create([
+                OrderDetail(_creator=self.user, _updater=self.user, order=order, product=product, quantity=quantity)
+                for quantity in (1, 2)
+            ])
+        self.url = f'/api/user/{self.user.id}/order/history'
+
+    def test_pages_embed_order_lines_in_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'page_size': 2}).json()
+
+        self.assertEqual(len(response['results']), 2)
+        self.assertIsNotNone(response['next'])
+        for order in response['results']:
+            self.assertEqual(sorted(line['quantity'] for line in order['details']), [1, 2])
+
+    def test_filters_by_status(self):
+        response = self.client.get(self.url, {'status': 'DONE'}).json()
+
+        self.assertEqual([order['order_status'] for order in response['results']], ['DONE', 'DONE'])
+
+class AdminGetUserHistoryTests(TestCase):
+    def setUp(self):
+        self.user = create_user('customer')
+        other = create_user('other')
+        now = timezone.now()
+        self.histories = [
+            History.objects.create(_creator=self.user, _created=now - timedelta(days=days), message=f'{days} days ago')
+            for days in (0, 1, 2, 10)
+        ]
+        History.objects.create(_creator=other, _created=now, message='someone else')
+        self.url = f'/api/admin/users/{self.user.id}/history'
+
+    def test_pages_walk_the_history_newest_first(self):
+        messages = []
+        response = self.client.get(self.url, {'page_size': 3}).json()
+        messages += [history['message'] for history in response['results']]
+        self.assertEqual(len(messages), 3)
+        response = self.client.get(response['next']).json()
+        messages += [history['message'] for history in response['results']]
+
+        self.assertEqual(messages, ['0 days ago', '1 days ago', '2 days ago', '10 days ago'])
+        self.assertIsNone(response['next'])
+
+    def test_filters_by_date_range(self):
+        start = timezone.localtime(self.histories[2]._created).date()
+        end = timezone.localtime(self.histories[1]._created).date()
+        response = self.client.get(self.url, {'start': start.isoformat(), 'end': end.isoformat()}).json()
+
+        self.assertEqual([history['message'] for history in response], ['1 days ago', '2 days ago'])
+
+    def test_rejects_malformed_dates(self):
+        response = self.client.get(self.url, {'start': 'yesterday'})
+
+        self.assertEqual(response.status_code, 400)
+
+class HistoryArchiveTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = create_user('customer')
+        now = timezone.now()
+        self.old = History.objects.create(_creator=self.user, _created=now - timedelta(days=200), message='đã tạo đơn hàng')
+        self.recent = History.objects.create(_creator=self.user, _created=now - timedelta(days=10), message='recent')
+        self.month = timezone.localtime(self.old._created).strftime('%Y-%m')
+
+    def archive(self, *args):
+        stdout = StringIO()
+        call_command('archive_history', '--dir', self.directory, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_moves_only_rows_older_than_the_retention_window(self):
+        self.archive('--days', '180')
+
+        self.assertEqual(list(History.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(
+            [path.name for path in Path(self.directory).iterdir()],
+            [f'history-{self.month}.ndjson.gz']
+        )
+
+    def test_dump_and_restore_round_trip(self):
+        self.archive('--days', '180', '--batch-size', '1')
+
+        rows = [json.loads(line) for line in self.archive('--dump', self.month).splitlines()]
+        self.assertEqual(
+            rows,
+            [{
+                'id': self.old.id,
+                '_creator': self.user.id,
+                '_created': self.old._created.isoformat(),
+                'message': 'đã tạo đơn hàng',
+            }]
+        )
+
+        self.archive('--restore', self.month)
+        self.archive('--restore', self.month)
+        restored = History.objects.get(id=self.old.id)
+        self.assertEqual((restored._created, restored.message), (self.old._created, self.old.message))
+        self.assertEqual(History.objects.count(), 2)
+
+    def test_rejects_malformed_month(self):
+        with self.assertRaises(CommandError):
+            self.archive('--dump', '2024-1')
+
+@override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+class AdminExportAPIViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_staff=True, is_superuser=True)
+        cls.customer = create_user('customer', name='Nguyễn Văn A', balance=1000000)
+        category = Category.objects.create(_creator=cls.admin, _updater=cls.admin, name='Burger')
+        product = Product.objects.create(_creator=cls.admin, _updater=cls.admin, name='Burger', category=category)
+        # One more order than fits in a chunk, with lines on both sides of the boundary
+        Order.objects.bulk_create([
+            Order(_creator=cls.customer, _updater=cls.customer, user=cls.customer, address='1 Le Loi', note='giao, "nhanh"', price=index)
+            for index in range(EXPORT_CHUNK_SIZE + 1)
+        ])
+        orders = list(Order.objects.order_by('id'))
+        OrderDetail.objects.bulk_create([
+            OrderDetail(_creator=cls.customer, _updater=cls.customer, order=order, product=product, name='Burger', price=10000, quantity=quantity)
+            for order in orders[EXPORT_CHUNK_SIZE - 2:] + orders[:1]
+            for quantity in (1, 2)
+        ])
+
+    def setUp(self):
+        invalidation_bus.poll(force=True)
+
+    def export(self, path, user, **params):
+        return self.client.generic(
+            'GET',
+            f'/api/admin/export/{path}?' + '&'.join(f'{key}={value}' for key, value in params.items()),
+            json.dumps({'token': create_token(user)}),
+            content_type='application/json'
+        )
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def expected_orders(self):
+        lines = {}
+        for line in OrderDetail.objects.order_by('id').values('order', *ORDER_LINE_FIELDS):
+            lines.setdefault(line.pop('order'), []).append(line)
+        return [
+            (order, lines.get(order['id'], []))
+            for order in Order.objects.order_by('id').values(*ORDER_FIELDS)
+        ]
+
+    def test_order_ndjson_matches_a_single_query(self):
+        rows = [json.loads(line) for line in self.content(self.export('orders', self.admin)).splitlines()]
+
+        expected = [
+            json.loads(json.dumps(dict(order, lines=lines), cls=DjangoJSONEncoder))
+            for order, lines in self.expected_orders()
+        ]
+        self.assertEqual(len(rows), EXPORT_CHUNK_SIZE + 1)
+        self.assertEqual(rows, expected)
+
+    def test_order_csv_matches_a_single_query(self):
+        rows = list(csv.reader(StringIO(self.content(self.export('orders', self.admin, output='csv')))))
+
+        expected = [list(ORDER_FIELDS) + [f'line__{field}' for field in ORDER_LINE_FIELDS]]
+        for order, lines in self.expected_orders():
+            for line in lines or [dict.fromkeys(ORDER_LINE_FIELDS, '')]:
+                values = [order[field] for field in ORDER_FIELDS] + [line[field] for field in ORDER_LINE_FIELDS]
+                # csv.writer writes None as an empty field
+                expected.append(['' if value is None else str(value) for value in values])
+        self.assertEqual(rows, expected)
+
+    def test_user_exports_match_a_single_query(self):
+        expected = list(User.objects.order_by('id').values(*USER_FIELDS))
+
+        rows = [json.loads(line) for line in self.content(self.export('users', self.admin)).splitlines()]
+        self.assertEqual(rows, [json.loads(json.dumps(user, cls=DjangoJSONEncoder)) for user in expected])
+
+        rows = list(csv.reader(StringIO(self.content(self.export('users', self.admin, output='csv')))))
+        self.assertEqual(rows[0], list(USER_FIELDS))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [user['id'] for user in expected])
+        self.assertEqual(rows[2][USER_FIELDS.index('name')], 'Nguyễn Văn A')
+
+    def test_rejects_callers_that_are_not_staff(self):
+        for path in ('orders', 'users'):
+            response = self.export(path, self.customer)
+            self.assertEqual(response.status_code, 403)
+
+    def test_rejects_unknown_output(self):
+        response = self.export('orders', self.admin, output='xlsx')
+
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(AUDIT_LOG_BUFFERED=False, CACHE_INVALIDATION_POLL_INTERVAL=60)
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidation_bus.poll(force=True)
+        product_index.reset()
+        self.admin = create_user('admin', is_staff=True)
+        burger = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        drink = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Đồ uống')
+        self.products = {
+            name: Product.objects.create(
+                _creator=self.admin,
+                _updater=self.admin,
+                name=name,
+                description=description,
+                category=category,
+            )
+            for name, description, category in (
+                ('Burger Gà Quay', 'Gà quay giòn', burger),
+                ('Burger Bò', 'Bò nướng, ăn kèm gà rán', burger),
+                ('Trà Đào', 'Trà đào cam sả', drink),
+                ('Gà Rán', 'Gà rán giòn cay', burger),
+            )
+        }
+
+    def search(self, query, **params):
+        response = self.client.get('/api/product/search', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()]
+
+    def test_ignores_diacritics_and_case(self):
+        self.assertEqual(self.search('burger GA QUAY'), ['Burger Gà Quay'])
+        self.assertEqual(self.search('trà đào'), self.search('TRA DAO'))
+        self.assertEqual(self.search('do uong'), ['Trà Đào'])
+
+    def test_matches_words_as_prefixes(self):
+        self.assertEqual(self.search('bur qu'), ['Burger Gà Quay'])
+        self.assertEqual(self.search('tr'), ['Trà Đào'])
+
+    def test_ranks_name_matches_above_description_matches(self):
+        self.assertEqual(self.search('ga'), ['Burger Gà Quay', 'Gà Rán', 'Burger Bò'])
+        self.assertEqual(self.search('ga', limit=1), ['Burger Gà Quay'])
+
+    def test_admin_writes_update_the_index(self):
+        token = create_token(self.admin)
+        self.assertEqual(self.search('ga'), ['Burger Gà Quay', 'Gà Rán', 'Burger Bò'])
+
+        product = self.products['Gà Rán']
+        response = self.client.delete(
+            f'/api/admin/product/{product.id}',
+            json.dumps({'token': token}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.search('ga'), ['Burger Gà Quay', 'Burger Bò'])
+
+        product = self.products['Trà Đào']
+        response = self.client.put(
+            f'/api/admin/product/{product.id}',
+            json.dumps({'token': token, 'name': 'Trà Vải'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.search('vai'), ['Trà Vải'])
+
+    def test_rejects_limit_out_of_range(self):
+        for limit in ('0', '-1', '101', 'ten'):
+            response = self.client.get('/api/product/search', {'q': 'ga', 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+    def test_other_processes_replay_the_change_log(self):
+        other = ProductSearchIndex()
+        other.build()
+        product = self.products['Burger Bò']
+        Product.objects.filter(id=product.id).update(name='Burger Heo')
+        product_index.update_product(product.id)
+        self.assertEqual(other.search('heo'), [])
+
+        with self.assertNumQueries(2):
+            other.sync()
+        self.assertEqual(other.search('heo'), [product.id])
+
+        Product.objects.filter(id=product.id).update(_deleted=timezone.now())
+        product_index.remove_product(product.id)
+        other.sync()
+        self.assertEqual(other.search('heo'), [])
+
+    def test_rebuilds_when_the_change_log_was_pruned(self):
+        other = ProductSearchIndex()
+        other.build()
+        with mock.patch('api.search.CHANGE_LOG_SIZE', 2):
+            for product in self.products.values():
+                Product.objects.filter(id=product.id).update(name=f'Combo {product.id}')
+                product_index.update_product(product.id)
+            other.sync()
+
+        self.assertEqual(len(other.search('combo')), len(self.products))
+
+@override_settings(CACHE_INVALIDATION_POLL_INTERVAL=60)
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidation_bus.poll(force=True)
+        self.admin = create_user('admin', is_staff=True, is_superuser=True)
+        self.staff = create_user('staff', is_staff=True)
+        category = Category.objects.create(_creator=self.admin, _updater=self.admin, name='Burger')
+        self.product = Product.objects.create(
+            _creator=self.admin,
+            _updater=self.admin,
+            name='Burger Gà',
+            description='Gà quay giòn',
+            category=category,
+        )
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries.captured_queries]
+
+    def test_fields_narrow_the_columns_and_joins(self):
+        products, queries = self.get('/api/product', fields='id,name')
+
+        self.assertEqual(products, [{'id': self.product.id, 'name': 'Burger Gà'}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('JOIN', queries[0])
+
+    def test_related_fields_keep_only_their_join(self):
+        products, queries = self.get('/api/product', fields='id,category_name')
+
+        self.assertEqual(products, [{'id': self.product.id, 'category_name': 'Burger'}])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"api_category"', queries[0])
+        self.assertNotIn('"api_productrating"', queries[0])
+        self.assertNotIn('"api_category"."image"', queries[0])
+
+    def test_exclude_drops_fields(self):
+        products, queries = self.get('/api/product', exclude='description,rating,image_variants')
+
+        self.assertNotIn('description', products[0])
+        self.assertNotIn('rating', products[0])
+        self.assertIn('category_name', products[0])
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('"api_productrating"', queries[0])
+
+    def test_computed_fields_read_their_sparse_sources(self):
+        users, queries = self.get('/api/admin/users', fields='username,role')
+
+        self.assertEqual(
+            sorted((user['username'], user['role']) for user in users),
+            [('admin', 'admin'), ('staff', 'staff')]
+        )
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"is_superuser"', queries[0])
+        self.assertNotIn('"email"', queries[0])
+
+    def test_rejects_unknown_fields(self):
+        response = self.client.get('/api/product', {'fields': 'id,price,colour'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Unknown fields: colour'})
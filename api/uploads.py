@@ -0,0 +1,170 @@
+import hashlib
+import os
+import re
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, UnidentifiedImageError
+from .cache import bump_catalog_version, bump_coupon_version
+from .images import iter_source_images, media_root, media_url, source_path
+from .models import Category, Coupon, Product, User
+
+UPLOAD_DIR = getattr(settings, 'IMAGE_UPLOAD_DIR', 'uploads')
+UPLOAD_MAX_BYTES = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+
+UPLOAD_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+# uploads/ab/<sha256>.<ext>
+UPLOAD_NAME_RE = re.compile(r'^%s/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.\w+$' % re.escape(UPLOAD_DIR))
+
+# Models and columns holding image paths or URLs
+IMAGE_COLUMNS = (
+    (User, 'image'),
+    (Product, 'image'),
+    (Category, 'image'),
+    (Coupon, 'image'),
+)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+class InvalidImage(Exception):
+    pass
+
+
+def upload_name(digest, ext):
+    return f'{UPLOAD_DIR}/{digest[:2]}/{digest}.{ext}'
+
+def upload_digest(name):
+    """
+    sha256 digest of a content-addressed upload name, or None.
+    """
+    match = UPLOAD_NAME_RE.match(name)
+    return None if match is None else match['digest']
+
+def store_image(chunks):
+    """
+    Write an uploaded image, given as an iterable of byte chunks, under
+    the sha256 of its content, hashing it while it is written. Content
+    that is already stored is not written twice.
+    Returns (name relative to MEDIA_ROOT, digest, size, created).
+    """
+    staging = media_root() / UPLOAD_DIR / 'tmp'
+    staging.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=staging, suffix='.upload')
+    try:
+        sha = hashlib.sha256()
+        size = 0
+        with os.fdopen(descriptor, 'wb') as output:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise UploadTooLarge(f'Image is larger than {UPLOAD_MAX_BYTES} bytes')
+                sha.update(chunk)
+                output.write(chunk)
+        try:
+            with Image.open(temporary) as image:
+                image_format = image.format
+                image.verify()
+        except Image.DecompressionBombError:
+            raise InvalidImage('Image has too many pixels')
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise InvalidImage('File is not an image')
+        if image_format not in UPLOAD_EXTENSIONS:
+            raise InvalidImage(f'Unsupported image format {image_format}')
+
+        digest = sha.hexdigest()
+        name = upload_name(digest, UPLOAD_EXTENSIONS[image_format])
+        target = media_root() / name
+        if target.exists():
+            os.unlink(temporary)
+            return name, digest, size, False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temporary, target)
+        return name, digest, size, True
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+def iter_request_chunks(request):
+    while True:
+        chunk = request.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def find_duplicates(directories=None):
+    """
+    Groups of media files (relative to MEDIA_ROOT) with identical content,
+    the file to keep first: a content-addressed upload if there is one,
+    else the shortest name, so Django's random suffixes go.
+    """
+    by_digest = defaultdict(list)
+    for name in iter_source_images(directories):
+        by_digest[file_digest(media_root() / name)].append(name)
+    return [
+        sorted(names, key=lambda name: (upload_digest(name) is None, len(name), name))
+        for names in by_digest.values()
+        if len(names) > 1
+    ]
+
+def replace_image_references(replacements):
+    """
+    Point every image column that refers to a key of replacements (names
+    relative to MEDIA_ROOT) at its value, keeping the way the column wrote
+    the path. Returns the number of rows updated.
+    """
+    updated = 0
+    with transaction.atomic():
+        for model, column in IMAGE_COLUMNS:
+            rows = model._base_manager.exclude(**{f'{column}__isnull': True}).exclude(**{column: ''})
+            for pk, image in rows.values_list('pk', column).iterator():
+                name = source_path(image)
+                if name not in replacements:
+                    continue
+                if image.endswith(name):
+                    new_image = image[:len(image) - len(name)] + replacements[name]
+                else:
+                    new_image = media_url(replacements[name])
+                model._base_manager.filter(pk=pk).update(**{column: new_image})
+                updated += 1
+    return updated
+
+def merge_duplicates(dry_run=False):
+    """
+    Keep one file of every group of identical media files, repoint the
+    image columns at it and delete the others.
+    Returns (groups, files removed, bytes reclaimed, rows updated).
+    """
+    groups = find_duplicates()
+    replacements = {}
+    reclaimed = 0
+    for keep, *duplicates in groups:
+        for name in duplicates:
+            replacements[name] = keep
+            reclaimed += (media_root() / name).stat().st_size
+    if dry_run or len(replacements) == 0:
+        return len(groups), len(replacements), reclaimed, 0
+    updated = replace_image_references(replacements)
+    for name in replacements:
+        Path(media_root() / name).unlink()
+    if updated > 0:
+        bump_catalog_version()
+        bump_coupon_version()
+    return len(groups), len(replacements), reclaimed, updated
@@ -1,4 +1,5 @@
 from django.urls import path
+from .async_views import async_api_view
 from .views import (
     RegisterView,
     LoginView,
@@ -8,11 +9,14 @@ from .views import (
     UpdatePasswordView,
     UpdateUserBalanceView,
     ProductsAPIView,
+    ProductSearchAPIView,
+    ImageUploadAPIView,
     SingleProductAPIView,
     CategoriesAPIView,
     SingleCategoryAPIView,
     GetProductFromCategory,
     UserOrderAPIView,
+    UserOrderHistoryAPIView,
     OrderAPIView,
     OrderDetailAPIView,
     CartsAPIView,
@@ -35,9 +39,12 @@ from .views import (
     AdminGetReviewsAPIView,
     AdminEditReviewsAPIView,
     AdminUsersAPIView,
+    AdminExportOrdersAPIView,
+    AdminExportUsersAPIView,
     AdminUserAPIView,
     AdminGetUserHistory,
     AdminOverviewStats,
+    AdminRevenueAPIView,
     AdminLast5DayTotalRevenue,
     AdminLast5MonthsRevenue,
     AdminCoupon,
@@ -53,15 +60,18 @@ urlpatterns = [
     path('user/update/password', UpdatePasswordView.as_view()),
     path('user/update/balance', UpdateUserBalanceView.as_view()),
     path('product', ProductsAPIView.as_view()),
+    path('product/search', ProductSearchAPIView.as_view()),
     path('product/<str:id>', SingleProductAPIView.as_view()),
     path('category', CategoriesAPIView.as_view()),
     path('category/<str:id>', SingleCategoryAPIView.as_view()),
     path('category/detail/<int:category_id>', GetProductFromCategory.as_view()),
     path('user/<str:user_id>/order', UserOrderAPIView.as_view()),
+    path('user/<str:user_id>/order/history', UserOrderHistoryAPIView.as_view()),
     path('order', OrderAPIView.as_view()),
     path('user/<str:user_id>/order/<int:order_id>', OrderDetailAPIView.as_view()),
     path('coupon', UserCoupons.as_view()),
     path('coupon/<str:coupon_code>', UserCoupon.as_view()),
+    path('upload/image', ImageUploadAPIView.as_view()),
     path('cart', CartsAPIView.as_view()),
     path('cart/<int:cart_id>', SingleCartAPIView.as_view()),
     path('cart/product/<int:product_id>', GetProductOnCartAPIView.as_view()),
@@ -84,7 +94,22 @@ urlpatterns = [
     path('admin/users', AdminUsersAPIView.as_view()),
     path('admin/users/<int:user_id>', AdminUserAPIView.as_view()),
     path('admin/users/<int:user_id>/history', AdminGetUserHistory.as_view()),
+    path('admin/export/orders', AdminExportOrdersAPIView.as_view()),
+    path('admin/export/users', AdminExportUsersAPIView.as_view()),
     path('admin/stats', AdminOverviewStats.as_view()),
     path('admin/revenue', AdminLast5DayTotalRevenue.as_view()),
     path('admin/revenue/months', AdminLast5MonthsRevenue.as_view()),
+    path('admin/revenue/range', AdminRevenueAPIView.as_view()),
+]
+
+# The catalog, review and coupon reads again, as async views for ASGI servers
+urlpatterns += [
+    path('async/product', async_api_view(ProductsAPIView)),
+    path('async/product/<str:id>', async_api_view(SingleProductAPIView)),
+    path('async/product/<int:product_id>/review', async_api_view(ReviewsFromProductAPIView)),
+    path('async/category', async_api_view(CategoriesAPIView)),
+    path('async/category/<str:id>', async_api_view(SingleCategoryAPIView)),
+    path('async/category/detail/<int:category_id>', async_api_view(GetProductFromCategory)),
+    path('async/coupon', async_api_view(UserCoupons)),
+    path('async/coupon/<str:coupon_code>', async_api_view(UserCoupon)),
 ]
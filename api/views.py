@@ -8,6 +8,7 @@ from .serializers import (
     CategorySerializer,
     OrderDetailSerializer,
     OrderSerializer,
+    OrderHistorySerializer,
     AdminOrderSerializer,
     CartSerializer,
     ReviewSerializer,
@@ -17,7 +18,8 @@ from .serializers import (
     CouponSerializer,
 )
 from django.db import IntegrityError, transaction
-from django.db.models import Sum
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.conf import settings
 from django.utils import timezone
 from .models import (
     User,
@@ -31,10 +33,31 @@ from .models import (
     FavoriteProduct,
     Coupon,
     CouponUsage,
+    DailySales,
 )
 import jwt
+from collections import defaultdict
 from datetime import date, datetime, timedelta
-from .helper import user_authentication, user_permission_authentication
+from .helper import user_authentication, header_authentication, user_permission_authentication, invalidate_user_role, date_range_filter, order_filter
+from .pagination import paginated_response, KeysetPagination, OrderPagination
+from .cache import (
+    cached_response,
+    bump_catalog_version,
+    bump_coupon_version,
+    coupon_cache,
+    get_or_compute,
+    product_cache,
+)
+from .ratings import add_review, update_review
+from .revenue import revenue_series
+from .sales import record_order_created, record_order_changed, record_orders_deleted
+from .audit import audit_log
+from .exports import order_csv, order_ndjson, streaming_export, user_csv, user_ndjson
+from .search import product_index
+from .fieldsets import sparse_fieldset
+from .images import derivative_urls, media_url
+from .placeholders import refresh_image_placeholder
+from .uploads import InvalidImage, UploadTooLarge, iter_request_chunks, store_image
 
 class RegisterView(APIView):
     def post(self, request):
@@ -98,10 +121,7 @@ class RegisterView(APIView):
             image=image,
             balance=1000000,
         )
-        History.objects.create(
-            _creator = user,
-            message = f"đã tạo user {username}",
-        )
+        audit_log(user.id, f"đã tạo user {username}")
         return Response(
             {
                 'detail': 'User created successfully',
@@ -169,10 +189,7 @@ class UpdateUserView(APIView):
         serializer = UserSerializer(user, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        History.objects.create(
-            _creator = user,
-            message = f"đã update user {user.username}",
-        )
+        audit_log(user.id, f"đã update user {user.username}")
         return Response(
             {
                 'detail': 'User info updated successfully'
@@ -201,7 +218,7 @@ class UpdatePasswordView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
         return Response(
             {'detail': 'Password changed successfully'},
             status=status.HTTP_200_OK
@@ -246,8 +263,7 @@ class UpdateUserBalanceView(APIView):
                 {'detail': 'Amount must be a positive number'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        user.balance += amount
-        user.save()
+        User.objects.filter(id=user.id).update(balance=F('balance') + amount)
         return Response(
             {'detail': 'Balance added successfully'},
             status=status.HTTP_200_OK
@@ -256,13 +272,14 @@ class UpdateUserBalanceView(APIView):
 class UserView(APIView):
     def get(self, request, user_id):
         try:
-            user = User.objects.get(id=user_id)
+            users, serializer_class = sparse_fieldset(request, User.objects.all(), UserSerializer)
+            user = users.get(id=user_id)
         except User.DoesNotExist:
             return Response(
                 {'detail': 'User not found'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        serializer = UserSerializer(user)
+        serializer = serializer_class(user)
 
         return Response(serializer.data)
 
@@ -277,15 +294,106 @@ class LogoutView(APIView):
         return response
 
 class ProductsAPIView(APIView):
+    @cached_response()
     def get(self, request):
-        products = Product.objects.all().filter(_deleted=None)
-        serializer = ProductSerializer(products, many=True)
+        products, serializer_class = sparse_fieldset(
+            request,
+            Product.objects.select_related('category', 'rating_summary'),
+            ProductSerializer,
+            keep=('_created',)
+        )
+        response = paginated_response(request, products, serializer_class, view=self)
+        if response is not None:
+            return response
+        serializer = serializer_class(products, many=True)
+        return Response(serializer.data)
+
+class ProductSearchAPIView(APIView):
+    def get(self, request):
+        """
+        Search products by name, category and description, ignoring
+        diacritics and matching words as prefixes: ?q=ga qu&limit=20
+        """
+        query = request.query_params.get('q', '').strip()
+        if len(query) == 0:
+            return Response(
+                {'detail': 'Missing parameters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = None
+        if limit is None or not 1 <= limit <= 100:
+            return Response(
+                {'detail': 'limit must be a number between 1 and 100'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        product_ids = product_index.search(query, limit)
+        products, serializer_class = sparse_fieldset(
+            request,
+            Product.objects.select_related('category', 'rating_summary'),
+            ProductSerializer
+        )
+        products = products.in_bulk(product_ids)
+        serializer = serializer_class(
+            [products[product_id] for product_id in product_ids if product_id in products],
+            many=True
+        )
         return Response(serializer.data)
 
+class ImageUploadAPIView(APIView):
+    def post(self, request):
+        """
+        Upload an image, as the "file" field of a multipart form or as the
+        raw request body, with the token in an "Authorization: Bearer"
+        header or ?token=. Identical images are stored once: the returned
+        path is derived from the content, 201 when it is new, else 200.
+        """
+        header_authentication(request)
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file', None)
+            if upload is None:
+                return Response(
+                    {'detail': 'Missing parameters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            chunks = upload.chunks()
+        else:
+            chunks = iter_request_chunks(request)
+        try:
+            name, digest, size, created = store_image(chunks)
+        except UploadTooLarge as error:
+            return Response(
+                {'detail': str(error)},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        except InvalidImage as error:
+            return Response(
+                {'detail': str(error)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            {
+                'image': media_url(name),
+                'digest': digest,
+                'size': size,
+                'image_variants': derivative_urls(name),
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
 class SingleProductAPIView(APIView):
+    @cached_response()
     def get(self, request, id):
-        product = Product.objects.get(id=id)
-        serializer = ProductSerializer(product, many=False)
+        products, serializer_class = sparse_fieldset(
+            request,
+            Product.all_objects.select_related('category', 'rating_summary'),
+            ProductSerializer,
+            keep=('_deleted',)
+        )
+        product = products.get(id=id)
+        serializer = serializer_class(product, many=False)
 
         if product._deleted == None:
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
@@ -293,16 +401,32 @@ class SingleProductAPIView(APIView):
         return Response(None, status=status.HTTP_400_BAD_REQUEST)
 
 class CategoriesAPIView(APIView):
+    @cached_response()
     def get(self, request):
-        categories = Category.objects.all().filter(_deleted=None)
-        serializer = CategorySerializer(categories, many=True)
+        categories, serializer_class = sparse_fieldset(
+            request,
+            Category.objects.all(),
+            CategorySerializer,
+            keep=('_created',)
+        )
+        response = paginated_response(request, categories, serializer_class, view=self)
+        if response is not None:
+            return response
+        serializer = serializer_class(categories, many=True)
         return Response(serializer.data)
 
 class SingleCategoryAPIView(APIView):
+    @cached_response()
     def get(self, request, id):
         data = request.data
-        category = Category.objects.get(id=id)
-        serializer = CategorySerializer(category, many=False)
+        categories, serializer_class = sparse_fieldset(
+            request,
+            Category.all_objects.all(),
+            CategorySerializer,
+            keep=('_deleted',)
+        )
+        category = categories.get(id=id)
+        serializer = serializer_class(category, many=False)
 
         if category._deleted == None:
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
@@ -310,9 +434,18 @@ class SingleCategoryAPIView(APIView):
         return Response(None, status=status.HTTP_400_BAD_REQUEST)
 
 class GetProductFromCategory(APIView):
+    @cached_response()
     def get(self, request, category_id):
-        products = Product.objects.filter(category=category_id, _deleted=None)
-        serializer = ProductSerializer(products, many=True)
+        products, serializer_class = sparse_fieldset(
+            request,
+            Product.objects.select_related('category', 'rating_summary').filter(category=category_id),
+            ProductSerializer,
+            keep=('_created',)
+        )
+        response = paginated_response(request, products, serializer_class, view=self)
+        if response is not None:
+            return response
+        serializer = serializer_class(products, many=True)
         return Response(serializer.data)
 
 class UserOrderAPIView(APIView):
@@ -331,12 +464,30 @@ class UserOrderAPIView(APIView):
                 {'detail': 'Not this user'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Order.objects.filter(_creator=user_id).delete()
+        with transaction.atomic():
+            orders = Order.objects.filter(_creator=user_id)
+            record_orders_deleted(orders)
+            orders.delete()
         return Response(
             {'detail': 'All orders deleted sucessfully'},
             status=status.HTTP_200_OK
         )
 
+class UserOrderHistoryAPIView(APIView):
+    def get(self, request, user_id):
+        """
+        Get orders with their lines embedded, newest first, paginated with
+        ?page_size= / ?cursor=, optionally filtered by ?status=
+        """
+        orders = Order.objects.filter(user=user_id).prefetch_related('detail_order_fk')
+        order_status = request.query_params.get('status', None)
+        if order_status is not None:
+            orders = orders.filter(order_status=order_status)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderHistorySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 class OrderAPIView(APIView):
     def post(self, request):
         payload = user_authentication(request)
@@ -356,11 +507,34 @@ class OrderAPIView(APIView):
                 {'detail': 'products is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not isinstance(order_products, list) or not all(isinstance(item, dict) for item in order_products):
+            return Response(
+                {'detail': 'products must be a list of product and quantity objects'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         if len(order_products) == 0:
             return Response(
                 {'detail': 'products is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        order_lines = []
+        try:
+            for item in order_products:
+                quantity = item['quantity']
+                # Not coerced: 2.5 or "3" is a client bug, not a quantity
+                if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+                    return Response(
+                        {'detail': 'Quantity must be a positive integer'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                order_lines.append((int(item['product']), quantity))
+        except KeyError:
+            return Response({'detail': 'Missing parameters'}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response(
+                {'detail': 'Invalid product or quantity'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         price = 0.0
         try:
             with transaction.atomic():
@@ -372,53 +546,61 @@ class OrderAPIView(APIView):
                     note=note
                 )
 
-                History.objects.create(
-                    _creator = user,
-                    message = "đã tạo đơn hàng",
-                )
+                audit_log(user.id, "đã tạo đơn hàng")
 
-                for item in request.data['products']:
-                    try:
-                        product = Product.objects.get(id=item['product'])
-                    except Product.DoesNotExist:
+                products = product_cache.get_many(
+                    product_id for product_id, quantity in order_lines
+                )
+                order_details = []
+                for product_id, quantity in order_lines:
+                    product = products.get(product_id)
+                    if product is None:
                         transaction.set_rollback(True)
                         return Response(
                             {'detail': 'Product not found'},
                             status=status.HTTP_400_BAD_REQUEST
                         )
-                    price += product.price * item['quantity']
-                if user.balance < price:
+                    price += product.price * quantity
+                    order_details.append(
+                        OrderDetail(
+                            _creator=user,
+                            _updater=user,
+                            order=order,
+                            product=product,
+                            quantity=quantity,
+                            name=product.name,
+                            image=product.image,
+                            price=product.price,
+                        )
+                    )
+
+                # Reserve stock for every product with one conditional UPDATE;
+                # a product without enough stock left is not updated at all.
+                reserved_quantities = defaultdict(int)
+                for product_id, quantity in order_lines:
+                    reserved_quantities[product_id] += quantity
+                reserved_quantity = Case(
+                    *[
+                        When(id=product_id, then=Value(quantity))
+                        for product_id, quantity in reserved_quantities.items()
+                    ],
+                    output_field=IntegerField()
+                )
+                reserved_count = Product.objects.filter(
+                    id__in=reserved_quantities.keys(),
+                    quantity__gte=reserved_quantity
+                ).update(quantity=F('quantity') - reserved_quantity)
+                if reserved_count != len(reserved_quantities):
                     transaction.set_rollback(True)
                     return Response(
-                        {'detail': 'Account balance is insufficient'},
+                        {'detail': 'Product is out of stock'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
-                for item in request.data['products']:
-                    product = Product.objects.filter(id=item['product']).first()
-                    data = item.copy()
-                    data['_creator'] = payload['id']
-                    data['_updater'] = payload['id']
-                    data['order'] = order.id
-
-                    # cart_item = Cart.objects.filter(
-                    #     product=product,
-                    #     _creator=user,
-                    #     _deleted=None
-                    #     ).first()
-                    # cart_item._deleted = datetime.now()
-                    # cart_item._updater = user
-                    # cart_item.save()
-
-                    serializer = OrderDetailSerializer(data=data)
-
-                    if serializer.is_valid(raise_exception=True):
-                        serializer.save()
-                        continue
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                OrderDetail.objects.bulk_create(order_details)
                 if coupon_code is not None:
                     try:
-                        coupon = Coupon.objects.get(code=coupon_code)
+                        coupon = coupon_cache.get(coupon_code)
                         if timezone.now() > coupon.expiry_date:
                             transaction.set_rollback(True)
                             return Response(
@@ -446,10 +628,19 @@ class OrderAPIView(APIView):
                             status=status.HTTP_400_BAD_REQUEST
                         )
                 price += shipping_cost
+                debited_count = User.objects.filter(
+                    id=user.id,
+                    balance__gte=price
+                ).update(balance=F('balance') - price)
+                if debited_count == 0:
+                    transaction.set_rollback(True)
+                    return Response(
+                        {'detail': 'Account balance is insufficient'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 order.price = price
                 order.save()
-                user.balance -= price
-                user.save()
+                record_order_created(order, sum(quantity for product_id, quantity in order_lines))
 
         except IntegrityError:
             return Response({'detail': 'Query error'},status=status.HTTP_400_BAD_REQUEST)
@@ -474,7 +665,7 @@ class UserCoupons(APIView):
 class UserCoupon(APIView):
     def get(self, request, coupon_code):
         try:
-            coupon = Coupon.objects.get(code=coupon_code)
+            coupon = coupon_cache.get(coupon_code)
             if timezone.now() > coupon.expiry_date:
                 return Response(
                     {'detail': 'coupon not found'},
@@ -491,7 +682,7 @@ class UserCoupon(APIView):
 class CartsAPIView(APIView):
     def get(self, request):
         payload = user_authentication(request)
-        cart_items = Cart.objects.filter(_deleted=None, _creator=payload['id'])
+        cart_items = Cart.objects.filter(_creator=payload['id'])
         serializer = CartSerializer(cart_items, many=True)
         return Response(serializer.data)
 
@@ -509,7 +700,7 @@ class CartsAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         try:
-            cart_item = Cart.objects.get(product=product_id, _deleted=None, _creator=payload['id'])
+            cart_item = Cart.objects.get(product=product_id, _creator=payload['id'])
             cart_item_quantity = request.data.get('quantity', None)
             if cart_item_quantity is None:
                 return Response(
@@ -541,7 +732,7 @@ class SingleCartAPIView(APIView):
     def delete(self, request, cart_id):
         payload = user_authentication(request)
         
-        cart_item = Cart.objects.filter(id=cart_id, _creator=payload['id']).first()
+        cart_item = Cart.all_objects.filter(id=cart_id, _creator=payload['id']).first()
 
         if cart_item._deleted is not None:
             return Response({
@@ -569,7 +760,7 @@ class SingleCartAPIView(APIView):
         payload = user_authentication(request)
         
         data = request.data.copy()
-        cart_item = Cart.objects.get(id=cart_id, _creator=payload['id'])
+        cart_item = Cart.all_objects.get(id=cart_id, _creator=payload['id'])
         if cart_item._deleted is not None:
             return Response({
                 'detail': 'Cart item is already deleted'
@@ -589,7 +780,7 @@ class GetProductOnCartAPIView(APIView):
     def get(self, request, product_id):
         payload = user_authentication(request)
         try:
-            cart_item = Cart.objects.get(product=product_id, _deleted=None, _creator=payload['id'])
+            cart_item = Cart.objects.get(product=product_id, _creator=payload['id'])
         except Cart.DoesNotExist:
             return Response(
                 {},
@@ -603,7 +794,7 @@ class GetProductOnCartAPIView(APIView):
         
         data = request.data.copy()
         try:
-            cart_item = Cart.objects.get(product=product_id, _deleted=None, _creator=payload['id'])
+            cart_item = Cart.objects.get(product=product_id, _creator=payload['id'])
         except Cart.DoesNotExist:
             return Response(
                 {'detail': 'cart item does not exist'},
@@ -655,26 +846,25 @@ class ReviewsAPIView(APIView):
         serializer = ReviewSerializer(data=data)
 
         if serializer.is_valid():
-            serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator=user,
-                message='đã review đơn hàng',
-            )
+            with transaction.atomic():
+                review = serializer.save()
+                add_review(review)
+            audit_log(payload['id'], 'đã review đơn hàng')
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ReviewsFromProductAPIView(APIView):
     def get(self, request, product_id):
-        order_details = OrderDetail.objects.filter(product=product_id)
-        orders = Order.objects.filter(id__in=order_details.values_list('order', flat=True))
-        reviews = Review.objects.filter(order__in=orders.values_list('id', flat=True), status='APPROVE')
+        reviews = Review.objects.filter(
+            order__detail_order_fk__product=product_id,
+            status='APPROVE'
+        ).select_related('_creator').distinct()
         serializer = ReviewSerializer(reviews, many=True)
         return Response(serializer.data)
 
 class UserGetFavoriteProducts(APIView):
     def get(self, request, user_id):
-        products = FavoriteProduct.objects.filter(_creator=user_id, _deleted=None)
+        products = FavoriteProduct.objects.filter(_creator=user_id)
         serializer = FavoriteProductSerializer(products, many=True)
         return Response(serializer.data)
 
@@ -688,7 +878,7 @@ class UserFavoriteProduct(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         try:
-            product = FavoriteProduct.objects.get(product=product_id, _deleted=None)
+            product = FavoriteProduct.objects.get(product=product_id, _creator=payload['id'])
             return Response(
                 {'detail': 'Favorite product created successfully'},
                 status=status.HTTP_200_OK
@@ -716,26 +906,34 @@ class UserFavoriteProduct(APIView):
                 {'product': 'This field is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        try:
-            product = FavoriteProduct.objects.get(product=product_id, _deleted=None)
-            product._deleted = datetime.now()
-            product.save()
-            return Response(
-                {'detail': 'Favorite product deleted successfully'},
-                status=status.HTTP_200_OK
-            )
-        except FavoriteProduct.DoesNotExist:
+        deleted_count = FavoriteProduct.objects.filter(product=product_id, _creator=payload['id']).soft_delete()
+        if deleted_count == 0:
             return Response(
                 {'detail': 'Favorite product already deleted'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        return Response(
+            {'detail': 'Favorite product deleted successfully'},
+            status=status.HTTP_200_OK
+        )
 
 class AdminGetOrdersAPIView(APIView):
     def get(self, request):
         """
-        Get all orders
+        Get orders, paginated with ?page_size= / ?cursor= (?ordering=_created or -_created)
+        Filters: start, end (YYYY-MM-DD), status, payment_method, user
         """
-        orders = Order.objects.order_by('_creator', '-order_status', '_created')
+        orders = order_filter(Order.objects.select_related('_creator'), request)
+        response = paginated_response(
+            request,
+            orders,
+            AdminOrderSerializer,
+            view=self,
+            paginator_class=OrderPagination
+        )
+        if response is not None:
+            return response
+        orders = orders.order_by('_creator', '-order_status', '_created')
         serializer = AdminOrderSerializer(orders, many=True)
         return Response(serializer.data)
 
@@ -754,21 +952,21 @@ class AdminOrderAPIView(APIView):
                 {'detail': 'Order not found'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        old_status = order.order_status
+        old_price = order.price
         serializer = AdminOrderSerializer(order, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        user = User.objects.filter(id=payload['id']).first()
-        History.objects.create(
-            _creator=user,
-            message = 'đã hoàn thành đơn hàng',
-        )
+        with transaction.atomic():
+            order = serializer.save()
+            record_order_changed(order, old_status, old_price)
+        audit_log(payload['id'], 'đã hoàn thành đơn hàng')
         return Response({'detail': 'Order updated successfully'})
 
 class AdminGetReviewsAPIView(APIView):
     def get(self, request, product_id):
-        order_details = OrderDetail.objects.filter(product=product_id)
-        orders = Order.objects.filter(id__in=order_details.values_list('order', flat=True))
-        reviews = Review.objects.filter(order__in=orders.values_list('id', flat=True))
+        reviews = Review.objects.filter(
+            order__detail_order_fk__product=product_id
+        ).select_related('_creator').distinct()
         serializer = ReviewSerializer(reviews, many=True)
         return Response(serializer.data)
 
@@ -782,20 +980,20 @@ class AdminEditReviewsAPIView(APIView):
                 {'detail': 'Review does not exist'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        old_status = review.status
+        old_rating = review.rating
         serializer = ReviewSerializer(review, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        user = User.objects.filter(id=payload['id']).first()
-        History.objects.create(
-            _creator=user,
-            message='đã cập nhật review'
-        )
+        with transaction.atomic():
+            review = serializer.save()
+            update_review(review, old_status, old_rating)
+        audit_log(payload['id'], 'đã cập nhật review')
         return Response({'detail': 'Review updated successfully'})
 
 class AdminUsersAPIView(APIView):
     def get(self, request):
-        users = User.objects.all()
-        serializer = AdminUserSerializer(users, many=True)
+        users, serializer_class = sparse_fieldset(request, User.objects.all(), AdminUserSerializer)
+        serializer = serializer_class(users, many=True)
         return Response(serializer.data)
 
     def post(self, request):
@@ -894,14 +1092,52 @@ class AdminUsersAPIView(APIView):
                 status=status.HTTP_200_OK
             )
 
+class AdminExportOrdersAPIView(APIView):
+    def get(self, request):
+        """
+        Stream orders with their lines as NDJSON (default) or CSV (?output=csv)
+        Filters: start, end (YYYY-MM-DD), status, payment_method, user
+        """
+        user_permission_authentication(request)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return Response(
+                {'detail': 'output must be ndjson or csv'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        orders = order_filter(Order.objects.all(), request)
+        lines = order_csv(orders) if output == 'csv' else order_ndjson(orders)
+        return streaming_export(lines, output, 'orders')
+
+class AdminExportUsersAPIView(APIView):
+    def get(self, request):
+        """
+        Stream users as NDJSON (default) or CSV (?output=csv)
+        Filters: start, end (YYYY-MM-DD, on date joined), status (active or inactive)
+        """
+        user_permission_authentication(request)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return Response(
+                {'detail': 'output must be ndjson or csv'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        users = date_range_filter(User.objects.all(), request, field='date_joined')
+        user_status = request.query_params.get('status', None)
+        if user_status is not None:
+            users = users.filter(is_active=user_status == 'active')
+        lines = user_csv(users) if output == 'csv' else user_ndjson(users)
+        return streaming_export(lines, output, 'users')
+
 class AdminUserAPIView(APIView):
     def get(self, request, user_id):
         """
         Get single user by user id
         """
         try:
-            user = User.objects.get(id=user_id)
-            serializer = AdminUserSerializer(user)
+            users, serializer_class = sparse_fieldset(request, User.objects.all(), AdminUserSerializer)
+            user = users.get(id=user_id)
+            serializer = serializer_class(user)
             return Response(serializer.data)
         except User.DoesNotExist:
             return Response(
@@ -924,21 +1160,30 @@ class AdminUserAPIView(APIView):
             date_of_birth = request.data.get('date_of_birth', None)
             password = request.data.get('password', None)
             image = request.data.get('image', None)
+            changed = []
             if name is not None:
                 user.name = name
+                changed.append('name')
             if email is not None:
                 user.email = email
+                changed.append('email')
             if password is not None:
                 user.set_password(password)
+                changed.append('password')
             if phone is not None:
                 user.phone = phone
+                changed.append('phone')
             if address is not None:
                 user.address = address
+                changed.append('address')
             if date_of_birth is not None:
                 user.date_of_birth = date_of_birth
+                changed.append('date_of_birth')
             if image is not None:
                 user.image = image
+                changed.append('image')
             if role is not None:
+                changed += ['is_superuser', 'is_staff']
                 if role == 'admin':
                     user.is_superuser = True
                     user.is_staff = False
@@ -948,7 +1193,9 @@ class AdminUserAPIView(APIView):
                 else:
                     user.is_superuser = False
                     user.is_staff = False
-            user.save()
+            # Not the whole row: balance may have been debited since it was read
+            user.save(update_fields=changed)
+            invalidate_user_role(user.id)
             return Response(
                 {'detail': 'User updated successfully'},
                 status=status.HTTP_200_OK
@@ -967,7 +1214,8 @@ class AdminUserAPIView(APIView):
         try:
             user = User.objects.get(id=user_id)
             user.is_active = False
-            user.save()
+            user.save(update_fields=['is_active'])
+            invalidate_user_role(user.id)
             return Response(
                 {'detail': 'User deleted successfully'},
                 status=status.HTTP_200_OK
@@ -980,8 +1228,16 @@ class AdminUserAPIView(APIView):
 
 class AdminProductsAPIView(APIView):
     def get(self, request):
-        products = Product.objects.all().filter(_deleted=None)
-        serializer = ProductSerializer(products, many=True)
+        products, serializer_class = sparse_fieldset(
+            request,
+            Product.objects.select_related('category', 'rating_summary'),
+            ProductSerializer,
+            keep=('_created',)
+        )
+        response = paginated_response(request, products, serializer_class, view=self)
+        if response is not None:
+            return response
+        serializer = serializer_class(products, many=True)
         return Response(serializer.data)
 
     """
@@ -999,19 +1255,24 @@ class AdminProductsAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator = user,
-                message = "đã tạo sản phẩm",
-            )
+            refresh_image_placeholder(serializer.instance)
+            bump_catalog_version()
+            product_index.update_product(serializer.instance.id)
+            audit_log(payload['id'], "đã tạo sản phẩm")
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class AdminSingleProductAPIView(APIView):
     def get(self, request, product_id):
-        product = Product.objects.get(id=product_id)
-        serializer = ProductSerializer(product, many=False)
+        products, serializer_class = sparse_fieldset(
+            request,
+            Product.all_objects.select_related('category', 'rating_summary'),
+            ProductSerializer,
+            keep=('_deleted',)
+        )
+        product = products.get(id=product_id)
+        serializer = serializer_class(product, many=False)
 
         if product._deleted == None:
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
@@ -1022,7 +1283,7 @@ class AdminSingleProductAPIView(APIView):
         payload = user_permission_authentication(request)
         data = request.data.copy()
         data['_updater'] = payload['id']
-        product = Product.objects.get(id=product_id)
+        product = Product.all_objects.get(id=product_id)
         if product._deleted is not None:
             return Response({
                 'detail': 'Product is already deleted'
@@ -1033,18 +1294,18 @@ class AdminSingleProductAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator = user,
-                message = "đã cập nhật sản phẩm",
-            )
+            if 'image' in serializer.validated_data:
+                refresh_image_placeholder(product)
+            bump_catalog_version()
+            product_index.update_product(product.id)
+            audit_log(payload['id'], "đã cập nhật sản phẩm")
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, product_id):
         payload = user_permission_authentication(request)
-        product = Product.objects.get(id=product_id)
+        product = Product.all_objects.get(id=product_id)
         if product._deleted is not None:
             return Response({
                 'detail': 'Product is already deleted'
@@ -1062,19 +1323,21 @@ class AdminSingleProductAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator = user,
-                message = "đã xóa sản phẩm",
-            )
+            bump_catalog_version()
+            product_index.remove_product(product.id)
+            audit_log(payload['id'], "đã xóa sản phẩm")
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class AdminCategoriesAPIView(APIView):
     def get(self, request):
-        categories = Category.objects.all().filter(_deleted=None)
-        serializer = CategorySerializer(categories, many=True)
+        categories, serializer_class = sparse_fieldset(
+            request,
+            Category.objects.all(),
+            CategorySerializer
+        )
+        serializer = serializer_class(categories, many=True)
         return Response(serializer.data)
     
     """
@@ -1092,19 +1355,23 @@ class AdminCategoriesAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator = user,
-                message = "đã tạo danh mục mới",
-            )
+            refresh_image_placeholder(serializer.instance)
+            bump_catalog_version()
+            audit_log(payload['id'], "đã tạo danh mục mới")
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class AdminSingleCategoryAPIView(APIView):
     def get(self, request, category_id):
-        category = Category.objects.get(id=category_id)
-        serializer = CategorySerializer(category, many=False)
+        categories, serializer_class = sparse_fieldset(
+            request,
+            Category.all_objects.all(),
+            CategorySerializer,
+            keep=('_deleted',)
+        )
+        category = categories.get(id=category_id)
+        serializer = serializer_class(category, many=False)
 
         if category._deleted == None:
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
@@ -1115,7 +1382,7 @@ class AdminSingleCategoryAPIView(APIView):
         payload = user_permission_authentication(request)
         data = request.data
         data['_updater'] = payload['id']
-        category = Category.objects.get(id=category_id)
+        category = Category.all_objects.get(id=category_id)
         if category._deleted is not None:
             return Response({
                 'detail': 'Category is already deleted'
@@ -1125,18 +1392,18 @@ class AdminSingleCategoryAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator = user,
-                message = "đã cập nhật danh mục"
-            )
+            if 'image' in serializer.validated_data:
+                refresh_image_placeholder(category)
+            bump_catalog_version()
+            product_index.update_category(category.id)
+            audit_log(payload['id'], "đã cập nhật danh mục")
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def delete(self, request, category_id):
         payload = user_permission_authentication(request)
-        category = Category.objects.get(id=category_id)
+        category = Category.all_objects.get(id=category_id)
         if category._deleted is not None:
             return Response({
                 'detail': 'Category is already deleted'
@@ -1153,96 +1420,112 @@ class AdminSingleCategoryAPIView(APIView):
 
         if serializer.is_valid():
             serializer.save()
-            user = User.objects.filter(id=payload['id']).first()
-            History.objects.create(
-                _creator = user,
-                message = "đã xóa danh mục",
-            )
+            bump_catalog_version()
+            audit_log(payload['id'], "đã xóa danh mục")
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class AdminGetProductFromCategory(APIView):
     def get(self, request, category_id):
-        products = Product.objects.filter(category=category_id, _deleted=None)
+        products = Product.objects.select_related('category', 'rating_summary').filter(category=category_id)
         serializer = ProductSerializer(products, many=True)
         return Response(serializer.data)
 
 class AdminGetUserHistory(APIView):
     def get(self, request, user_id):
-        histories = History.objects.filter(_creator=user_id)
-        serializer = HistorySerializer(histories, many=True)
+        histories = date_range_filter(History.objects.filter(_creator=user_id), request)
+        response = paginated_response(request, histories, HistorySerializer, view=self)
+        if response is not None:
+            return response
+        serializer = HistorySerializer(histories.order_by('-_created', '-id'), many=True)
         return Response(serializer.data)
 
 class AdminOverviewStats(APIView):
     def get(self, request):
-        all_users_count = User.objects.all().count()
-        admin_count = User.objects.filter(is_superuser=True).count()
-        staff_count = User.objects.filter(is_staff=True, is_superuser=False).count()
-        user_count = User.objects.filter(is_staff=False, is_superuser=False).count()
-        order_count = Order.objects.all().count()
-        pending_order_count = Order.objects.filter(order_status='PENDING').count()
-        done_order_count = Order.objects.filter(order_status='DONE').count()
-        done_order_total_money = Order.objects.filter(order_status='DONE').aggregate(Sum('price'))
+        stats = get_or_compute(
+            'admin:overview_stats',
+            self.compute_stats,
+            settings.ADMIN_STATS_CACHE_SECONDS
+        )
         return Response(
-            {
-                'total_user': all_users_count,
-                'admin': admin_count,
-                'staff': staff_count,
-                'user': user_count,
-                'total_order': order_count,
-                'order_is_doned': done_order_count,
-                'order_in_progress': pending_order_count,
-                'doned_order_total': done_order_total_money['price__sum']
-            },
+            stats,
+            status=status.HTTP_200_OK
+        )
+
+    @staticmethod
+    def compute_stats():
+        users = User.objects.aggregate(
+            total=Count('id'),
+            admin=Count('id', filter=Q(is_superuser=True)),
+            staff=Count('id', filter=Q(is_staff=True, is_superuser=False)),
+            user=Count('id', filter=Q(is_staff=False, is_superuser=False)),
+        )
+        sales = DailySales.objects.aggregate(
+            order_count=Sum('order_count'),
+            pending_count=Sum('pending_count'),
+            done_count=Sum('done_count'),
+            revenue=Sum('revenue'),
+        )
+        return {
+            'total_user': users['total'],
+            'admin': users['admin'],
+            'staff': users['staff'],
+            'user': users['user'],
+            'total_order': sales['order_count'] or 0,
+            'order_is_doned': sales['done_count'] or 0,
+            'order_in_progress': sales['pending_count'] or 0,
+            'doned_order_total': sales['revenue']
+        }
+
+class AdminRevenueAPIView(APIView):
+    def get(self, request):
+        """
+        Revenue of done orders between start and end (YYYY-MM-DD, inclusive)
+        grouped by granularity: day, week or month
+        """
+        today = timezone.localdate()
+        try:
+            start = date.fromisoformat(request.query_params.get('start', str(today - timedelta(days=30))))
+            end = date.fromisoformat(request.query_params.get('end', str(today)))
+        except ValueError:
+            return Response(
+                {'detail': 'start and end must be dates in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        granularity = request.query_params.get('granularity', 'day')
+        try:
+            series = revenue_series(start, end, granularity)
+        except ValueError as error:
+            return Response(
+                {'detail': str(error)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(
+            [{'date': str(day), 'total': total} for day, total in series],
             status=status.HTTP_200_OK
         )
 
 class AdminLast5DayTotalRevenue(APIView):
     def get(self, request):
-        data = {}
         MAX_DATE = 5
-        for i in range(0, MAX_DATE + 1):
-            data[str(date.today() - timedelta(i))] = 0
-
-        for key in data.keys():
-            temp = datetime.strptime(key, '%Y-%m-%d')
-            obj_list = Order.objects.filter(
-                _created__year=str(temp.year),
-                _created__month=str(temp.month),
-                _created__day=str(temp.day),
-                order_status='DONE'
-            ).aggregate(Sum('price'))
-            if obj_list['price__sum'] is not None:
-                data[key] = obj_list['price__sum']
-            else:
-                data[key] = 0
-
+        today = timezone.localdate()
+        series = revenue_series(today - timedelta(days=MAX_DATE), today, 'day')
+        data = {str(day): total for day, total in reversed(series)}
         return Response(
             data,
             status=status.HTTP_200_OK
         )
+
 class AdminLast5MonthsRevenue(APIView):
     def get(self, request):
-        data = {}
         MAX_MONTH = 5
-        temp = date.today()
-        for i in range(0, MAX_MONTH + 1):
-            data[str(f'{temp.year}-{temp.month}')] = 0
-            temp -= timedelta(weeks=4)
-        for key in data.keys():
-            date_string = str(key).split('-')
-            temp_month = date_string[1]
-            temp_year = date_string[0]
-            obj_list = Order.objects.filter(
-                _created__year=str(temp_year),
-                _created__month=str(temp_month),
-                order_status='DONE'
-            ).aggregate(Sum('price'))
-            if obj_list['price__sum'] is not None:
-                data[key] = obj_list['price__sum']
-            else:
-                data[key] = 0
+        today = timezone.localdate()
+        start = today.replace(day=1)
+        for i in range(MAX_MONTH):
+            start = (start - timedelta(days=1)).replace(day=1)
+        series = revenue_series(start, today, 'month')
+        data = {f'{day.year}-{day.month}': total for day, total in reversed(series)}
         return Response(data)
 
 class AdminCoupons(APIView):
@@ -1297,6 +1580,7 @@ class AdminCoupons(APIView):
             expiry_date=expiry_date,
             image=image
         )
+        bump_coupon_version()
         return Response(
             {'detail': 'Coupon created successfully'},
             status=status.HTTP_200_OK
@@ -1336,6 +1620,7 @@ class AdminCoupon(APIView):
         if image is not None:
             coupon.image = image
         coupon.save()
+        bump_coupon_version()
         return Response(
             {'detail': 'coupon edited successfully'},
             status=status.HTTP_200_OK
@@ -1346,6 +1631,7 @@ class AdminCoupon(APIView):
         try:
             coupon = Coupon.objects.get(id=coupon_id)
             coupon.delete()
+            bump_coupon_version()
             return Response(
                 {'detail': 'coupon deleted successfully'},
                 status=status.HTTP_200_OK
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.invalidation.InvalidationMiddleware',
 ]
 
 ROOT_URLCONF = 'django_api.urls'
@@ -91,6 +92,44 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a cached catalog response is kept; admin writes invalidate it earlier
+CATALOG_CACHE_TIMEOUT = 300
+
+# Seconds between two reads of the CacheVersion table by a worker, see api.invalidation
+CACHE_INVALIDATION_POLL_INTERVAL = 1.0
+
+# Search index changes kept for the other workers to replay, a worker
+# further behind rebuilds its index
+SEARCH_CHANGE_LOG_SIZE = 10000
+
+# Product and coupon rows kept per process (and in CACHES) for checkout lookups
+OBJECT_CACHE_SIZE = 2048
+OBJECT_CACHE_TIMEOUT = 300
+
+# Seconds the admin overview stats are served from cache before one request recomputes them
+ADMIN_STATS_CACHE_SECONDS = 5
+
+# History entries are queued per process and written in batches of up to
+# AUDIT_LOG_MAX_BATCH rows or after AUDIT_LOG_MAX_DELAY seconds. Set
+# AUDIT_LOG_BUFFERED to False to write each entry immediately (tests).
+AUDIT_LOG_BUFFERED = True
+AUDIT_LOG_MAX_BATCH = 100
+AUDIT_LOG_MAX_DELAY = 2.0
+
+# In-process caches used by api.helper for verified JWT payloads and user roles
+TOKEN_CACHE_SIZE = 4096
+ROLE_CACHE_SIZE = 1024
+ROLE_CACHE_TTL = 30
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -144,5 +183,40 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Page size for cursor paginated listings (?page_size= overrides, capped by the max)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
 MEDIA_ROOT = BASE_DIR / 'media'
-MEDIA_URL = 'media/'
\ No newline at end of file
+MEDIA_URL = 'media/'
+
+# Seconds browsers may cache media files whose name is not content-addressed
+MEDIA_CACHE_SECONDS = 3600
+# Let the front proxy send media files: None (served by Django),
+# 'x-accel-redirect' (nginx, internal location MEDIA_ACCEL_REDIRECT_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Resized and WebP copies of the images under IMAGE_SOURCE_DIRS, built in
+# MEDIA_ROOT/IMAGE_DERIVATIVE_DIR. Sizes are maximum widths in pixels.
+IMAGE_DERIVATIVE_DIR = 'derivatives'
+IMAGE_DERIVATIVE_SIZES = {
+    'thumb': 160,
+    'small': 320,
+    'medium': 640,
+}
+IMAGE_SOURCE_DIRS = ['product_image', 'category_image', 'avatars', 'uploads']
+
+# Images uploaded through api/upload/image are stored once per content,
+# as MEDIA_ROOT/IMAGE_UPLOAD_DIR/<sha256[:2]>/<sha256>.<ext>
+IMAGE_UPLOAD_DIR = 'uploads'
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# Blurhash components (x, y) of the placeholders stored with product and
+# category images
+IMAGE_PLACEHOLDER_COMPONENTS = (4, 3)
+
+# History rows older than HISTORY_RETENTION_DAYS are moved here by the archive_history command
+HISTORY_ARCHIVE_DIR = BASE_DIR / 'archive' / 'history'
+HISTORY_RETENTION_DAYS = 180
@@ -16,9 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from api.media import serve_derivative, serve_media
+
+MEDIA_PREFIX = settings.MEDIA_URL.lstrip('/')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path(f'{MEDIA_PREFIX}{settings.IMAGE_DERIVATIVE_DIR}/<path:derivative>', serve_derivative),
+    path(f'{MEDIA_PREFIX}<path:path>', serve_media),
+]